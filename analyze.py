@@ -0,0 +1,187 @@
+"""This analyses a large batch of positions and writes the results as JSONL.
+
+Positions are read one per line as PDN FEN strings (see pdn.py), from a
+file or standard input; blank lines and lines starting with # are
+skipped. They are searched in parallel worker processes to a fixed
+depth, for a fixed time or both, and each result is written as one line
+of JSON in the same order as the input:
+
+    {"line": 1, "fen": "B:W21-32:B1-12", "move": "11-15", "score": 0, ...}
+
+Only a few positions per worker are read ahead, so memory use stays the
+same however long the input is.
+
+    python analyze.py positions.txt --depth 8 --output results.jsonl
+    some-export | python analyze.py --time 0.5 > results.jsonl
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import book
+import evaluation
+import tablebase
+from engine import Position
+from pdn import parse_fen, pdn_move
+from search import MAX_DEPTH, TABLEBASE_WIN, Searcher
+
+# How many positions each worker may have queued or in progress.
+READ_AHEAD = 4
+
+
+def analyze_position(searcher, position, depth, time_limit,
+                     opening_book=None, stop_event=None):
+    """This finds the best move for a position and returns it as a dict.
+
+    Finished games, forced moves and book moves are answered without a
+    search. Moves are written as PDN and scores are from Red's side.
+    """
+    winner = position.winner()
+    if winner is not None:
+        return {"move": None, "winner": winner}
+    moves = position.legal_moves()
+    if len(moves) == 1:
+        return {"move": pdn_move(moves[0]), "source": "forced"}
+    book_move = opening_book.probe(position) if opening_book else None
+    if book_move:
+        return {"move": pdn_move(book_move), "source": "book"}
+
+    result = searcher.iterative_deepening(position, time_limit, depth,
+                                          stop_event=stop_event)
+    if result is None:
+        # No iteration finished, which only happens with a depth below 1.
+        return {"move": None, "error": f"depth {depth} searches nothing"}
+    summary = searcher.summary()
+    return {
+        "move": pdn_move(result.move),
+        "source": "search",
+        "score": finite_score(result.score),
+        "depth": result.depth,
+        "pv": [pdn_move(move) for move in result.pv],
+        "nodes": summary["nodes"] + summary["quiescence_nodes"],
+        "elapsed": round(summary["elapsed"], 4),
+    }
+
+
+def finite_score(score):
+    """This returns a score that JSON can hold.
+
+    A side with no moves left inside the horizon scores infinity, which is
+    reported as a tablebase win instead.
+    """
+    if math.isinf(score):
+        return TABLEBASE_WIN if score > 0 else -TABLEBASE_WIN
+    return score
+
+
+# These are only set inside worker processes, by _init_worker.
+_searcher = None
+_book = None
+
+
+def _init_worker(use_book):
+    """This sets up the per-process searcher, and the book if it is wanted."""
+    global _searcher, _book
+    _searcher = Searcher(tablebase=tablebase.load(),
+                         evaluator=evaluation.load())
+    _book = book.load() if use_book else None
+
+
+def _analyze_line(packed, depth, time_limit):
+    """This analyses one packed position in a worker."""
+    return analyze_position(_searcher, Position.unpack(packed), depth,
+                            time_limit, _book)
+
+
+def read_positions(lines):
+    """This yields (line number, FEN, packed position or error message)."""
+    for number, line in enumerate(lines, start=1):
+        text = line.strip()
+        if not text or text.startswith("#"):
+            continue
+        try:
+            yield number, text, parse_fen(text).pack()
+        except ValueError as error:
+            yield number, text, str(error)
+
+
+def run(lines, depth=MAX_DEPTH, time_limit=math.inf, workers=None,
+        use_book=False):
+    """This yields a result dict for each position, in input order."""
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(use_book,)) as executor:
+        for number, text, packed in read_positions(lines):
+            if isinstance(packed, str):
+                # Bad lines still get a result, so the output lines up.
+                pending.append((number, text, packed))
+            else:
+                pending.append((number, text,
+                                executor.submit(_analyze_line, packed, depth,
+                                                time_limit)))
+            # The oldest result is written before more input is read.
+            while len(pending) > workers * READ_AHEAD:
+                yield _result(*pending.popleft())
+        while pending:
+            yield _result(*pending.popleft())
+
+
+def _result(number, text, outcome):
+    """This waits for one position's analysis and labels it."""
+    result = {"line": number, "fen": text}
+    if isinstance(outcome, str):
+        result["error"] = outcome
+    else:
+        result.update(outcome.result())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input",
+                        nargs="?",
+                        help="a file of FEN positions (default: stdin)")
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--time",
+                        type=float,
+                        default=None,
+                        help="seconds of search per position")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--book",
+                        action="store_true",
+                        help="answer book positions from the opening book")
+    parser.add_argument("--output", help="write here instead of stdout")
+    args = parser.parse_args()
+    if args.depth is None and args.time is None:
+        parser.error("give a --depth, a --time or both")
+    if args.depth is not None and not 1 <= args.depth <= MAX_DEPTH:
+        parser.error(f"--depth must be between 1 and {MAX_DEPTH}")
+    if args.time is not None and not args.time > 0:
+        parser.error("--time must be positive")
+
+    source = open(args.input) if args.input else sys.stdin
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for result in run(source,
+                          args.depth if args.depth is not None else MAX_DEPTH,
+                          args.time if args.time is not None else math.inf,
+                          args.workers,
+                          args.book):
+            output.write(json.dumps(result, allow_nan=False) + "\n")
+            output.flush()
+    finally:
+        if args.input:
+            source.close()
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""This is the benchmark harness for move generation and search speed.
+
+Perft counts the leaf nodes of the full move tree to a fixed depth. The
+counts double as a correctness check on the move generator, and timing
+them gives its nodes per second. The search benchmark runs a fixed-depth
+principal variation search on the same positions and reports time,
+nodes (with the quiescence nodes broken out), NPS and peak memory, and
+how hard it works the allocator: the memory blocks still held after the
+search per node, and how many times the garbage collector ran. The
+plain minimax search is run too, as a baseline at the same depth.
+Results are written as JSON so runs from different versions can be
+compared:
+
+    python bench.py --output bench.json
+    python bench.py --output new.json --compare bench.json
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from engine import RED, Position
+from search import Searcher
+
+# Each entry is (packed position, expected perft counts by depth).
+BENCH_POSITIONS = {
+    "start": ((0x00000FFF, 0xFFF00000, 0x0, 0),
+              [7, 49, 302, 1469, 7361, 36768]),
+    "opening": ((0x000008DF, 0xF8D00400, 0x0, 1),
+                [2, 22, 170, 1308, 9626, 69064]),
+    "middlegame": ((0x00008B03, 0xA7900080, 0x0, 0),
+                   [10, 90, 746, 5136, 37927, 214852]),
+    "forced": ((0x00002D0C, 0xB3005000, 0x0, 0),
+               [2, 2, 9, 50, 273, 1389]),
+    "kings": ((0x00004220, 0x48400000, 0x08404020, 1),
+              [7, 42, 267, 1612, 11130, 66812]),
+}
+
+
+def perft(position, depth):
+    """This counts the leaf nodes of the move tree to the given depth."""
+    if depth == 0:
+        return 1
+    moves = position.legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+def bench_perft(depth):
+    """This runs perft on every position and checks the expected counts."""
+    results = {}
+    for name, (packed, expected) in BENCH_POSITIONS.items():
+        position = Position.unpack(packed)
+        start = time.perf_counter()
+        nodes = perft(position, depth)
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            "depth": depth,
+            "nodes": nodes,
+            "expected": expected[depth - 1] if depth <= len(expected) else None,
+            "time": elapsed,
+            "nodes_per_second": nodes / elapsed if elapsed else 0.0,
+        }
+        results[name]["correct"] = results[name]["expected"] in (None, nodes)
+    return results
+
+
+def run_search(searcher, position, depth, algorithm):
+    """This runs one fixed-depth search and returns (score, move) for Red."""
+    if algorithm == "minimax":
+        return searcher.minimax(position, depth, position.turn == RED,
+                                float('-inf'), float('inf'))
+    return searcher.aspiration_search(position, depth)
+
+
+def gc_collections():
+    """This counts the garbage collections so far, over every generation."""
+    return sum(stats["collections"] for stats in gc.get_stats())
+
+
+def bench_search(depth, memory=True, algorithm="pvs", gc_threshold=None):
+    """This times a fixed-depth search on every position.
+
+    The algorithm is "pvs", the search the game uses, or "minimax", and
+    gc_threshold is passed on to the Searcher. Peak memory comes from a
+    second, traced run, because tracemalloc slows the search down too
+    much to time it at the same time. CPython doesn't count allocations
+    as they happen, so blocks_per_node is the growth in allocated blocks
+    (mostly transposition table entries), which is what the garbage
+    collector has to keep scanning.
+    """
+    results = {}
+    for name, (packed, _) in BENCH_POSITIONS.items():
+        position = Position.unpack(packed)
+        searcher = Searcher(gc_threshold=gc_threshold)
+        # Leftovers from the last position shouldn't be collected in this one.
+        gc.collect()
+        blocks = sys.getallocatedblocks()
+        collections = gc_collections()
+        start = time.perf_counter()
+        with searcher.collection_settings():
+            score, move = run_search(searcher, position, depth, algorithm)
+        elapsed = time.perf_counter() - start
+        collections = gc_collections() - collections
+        blocks = sys.getallocatedblocks() - blocks
+        nodes = searcher.nodes + searcher.quiescence_nodes
+        results[name] = {
+            "depth": depth,
+            "score": score,
+            "move": move,
+            "nodes": nodes,
+            "quiescence_nodes": searcher.quiescence_nodes,
+            "evaluations": searcher.evaluations,
+            "researches": searcher.researches,
+            "time": elapsed,
+            "nodes_per_second": nodes / elapsed if elapsed else 0.0,
+            "blocks_per_node": blocks / nodes if nodes else 0.0,
+            "gc_collections": collections,
+        }
+        if memory:
+            tracemalloc.start()
+            run_search(Searcher(gc_threshold=gc_threshold),
+                       Position.unpack(packed), depth, algorithm)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[name]["peak_memory"] = peak
+    return results
+
+
+def totals(results):
+    """This adds up the nodes and time over every position."""
+    nodes = sum(result["nodes"] for result in results.values())
+    elapsed = sum(result["time"] for result in results.values())
+    total = {
+        "nodes": nodes,
+        "time": elapsed,
+        "nodes_per_second": nodes / elapsed if elapsed else 0.0,
+    }
+    if all("gc_collections" in result for result in results.values()):
+        total["gc_collections"] = sum(result["gc_collections"]
+                                      for result in results.values())
+    if all("peak_memory" in result for result in results.values()):
+        total["peak_memory"] = max(result["peak_memory"]
+                                   for result in results.values())
+    return total
+
+
+def versus(search_results, baseline_results):
+    """This compares two searches of the same positions at the same depth."""
+    rows = {}
+    for name, result in search_results.items():
+        baseline = baseline_results[name]
+        rows[name] = {
+            "same_move": result["move"] == baseline["move"],
+            "same_score": result["score"] == baseline["score"],
+            "node_ratio": (result["nodes"] / baseline["nodes"]
+                           if baseline["nodes"] else 0.0),
+            "time_ratio": (result["time"] / baseline["time"]
+                           if baseline["time"] else 0.0),
+        }
+    return rows
+
+
+def run(perft_depth, search_depth, memory=True, gc_threshold=None):
+    """This runs every benchmark and returns the report as a dict."""
+    perft_results = bench_perft(perft_depth)
+    search_results = bench_search(search_depth, memory, "pvs", gc_threshold)
+    minimax_results = bench_search(search_depth, memory, "minimax",
+                                   gc_threshold)
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "perft": perft_results,
+        "perft_total": totals(perft_results),
+        "gc_threshold": gc_threshold,
+        "search": search_results,
+        "search_total": totals(search_results),
+        "minimax": minimax_results,
+        "minimax_total": totals(minimax_results),
+        "search_vs_minimax": versus(search_results, minimax_results),
+    }
+
+
+def compare(report, baseline):
+    """This prints the NPS of each section relative to an earlier report."""
+    for section in ("perft_total", "search_total"):
+        if section not in baseline:
+            continue
+        old = baseline[section]["nodes_per_second"]
+        new = report[section]["nodes_per_second"]
+        ratio = new / old if old else 0.0
+        print(f"{section}: {new:.0f} nps vs {old:.0f} nps ({ratio:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--perft-depth", type=int, default=6)
+    parser.add_argument("--search-depth", type=int, default=8)
+    parser.add_argument("--no-memory",
+                        action="store_true",
+                        help="skip the traced run that measures peak memory")
+    parser.add_argument("--gc-threshold",
+                        type=int,
+                        default=None,
+                        help="the garbage collector's generation-0 threshold "
+                        "during searches; 0 turns it off")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="an earlier JSON report to compare")
+    args = parser.parse_args()
+
+    report = run(args.perft_depth, args.search_depth, not args.no_memory,
+                 args.gc_threshold)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as handle:
+            compare(report, json.load(handle))
+
+    wrong = [name for name, result in report["perft"].items()
+             if not result["correct"]]
+    if wrong:
+        print(f"Perft mismatch in: {', '.join(wrong)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
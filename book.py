@@ -0,0 +1,209 @@
+"""This builds and probes the opening book.
+
+Every game starts from the same position, so the first few moves can be
+worked out once, offline, with a much deeper search than the game can
+afford. The book is built by exploring the opening tree: at positions
+where the book side is to move, a deep search picks the move and only
+that move is followed; at the opponent's positions every reply is
+followed, since a human might play any of them.
+
+The file is a header followed by fixed-size records sorted by position
+hash, so a lookup is a binary search over a memory-mapped file.
+
+    python book.py --plies 8 --time 2 --output opening.book
+"""
+
+import argparse
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import tablebase
+from engine import BLACK, RED, Position
+from search import Searcher
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CKOB"
+# Bumped whenever the record layout or the meaning of a move changes.
+BOOK_VERSION = 2
+HEADER = struct.Struct("<4sHI")  # magic, version, record count
+RECORD = struct.Struct("<Q13shB")  # hash, move squares, score, depth
+
+# Unused move squares are filled with this. A move captures at most the
+# opponent's twelve pieces, so it never has more than 13 squares.
+NO_SQUARE = 0xFF
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "opening.book")
+
+
+class OpeningBook:
+    """This is a read-only, memory-mapped opening book."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.handle = open(path, "rb")
+        self.data = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != BOOK_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {BOOK_VERSION} "
+                             "opening book; please rebuild it.")
+        self.hits = 0
+
+    def close(self):
+        """This unmaps the file."""
+        self.data.close()
+        self.handle.close()
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, key):
+        """This returns (move, score, depth) for a position hash, or None."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            record_key, squares, score, depth = RECORD.unpack_from(
+                self.data, HEADER.size + middle * RECORD.size)
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                return tuple(squares.rstrip(bytes([NO_SQUARE]))), score, depth
+        return None
+
+    def probe(self, position):
+        """This returns the book move for the position, or None."""
+        found = self.lookup(position.hash)
+        # The legality check guards against the odd hash collision.
+        if found is None or found[0] not in position.legal_moves():
+            return None
+        self.hits += 1
+        return found[0]
+
+
+def write_book(entries, path=DEFAULT_PATH):
+    """This writes {hash: (move, score, depth)} out as a sorted book file."""
+    with open(path, "wb") as handle:
+        handle.write(HEADER.pack(MAGIC, BOOK_VERSION, len(entries)))
+        for key in sorted(entries):
+            move, score, depth = entries[key]
+            # Scores are clamped to fit the record. A decided position
+            # scores infinity, which int() can't convert.
+            if math.isinf(score):
+                score = 32767 if score > 0 else -32767
+            score = max(-32767, min(32767, int(score)))
+            squares = bytes(move).ljust(13, bytes([NO_SQUARE]))
+            handle.write(RECORD.pack(key, squares, score, depth))
+    return path
+
+
+# This is only set inside worker processes, by _init_worker.
+_searcher = None
+
+
+def _init_worker():
+    """This sets up the per-process searcher."""
+    global _searcher
+    _searcher = Searcher(tablebase=tablebase.load())
+
+
+def _search_position(packed, time_limit, max_depth):
+    """This picks the book move for one position in a worker."""
+    position = Position.unpack(packed)
+    result = _searcher.iterative_deepening(position, time_limit, max_depth)
+    if result is None or result.move is None:
+        return packed, None
+    return packed, (result.move, result.score, result.depth)
+
+
+def build(plies, time_limit, max_depth, sides=(RED, BLACK), workers=None,
+          progress=None):
+    """This explores the opening tree and returns the book entries."""
+    entries = {}
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker) as executor:
+        for book_side in sides:
+            frontier = {Position.initial().hash: Position.initial()}
+            for ply in range(plies):
+                to_search = [position.pack() for position in frontier.values()
+                             if position.turn == book_side]
+                chosen = {}
+                for packed, entry in executor.map(
+                        _search_position, to_search,
+                        [time_limit] * len(to_search),
+                        [max_depth] * len(to_search)):
+                    if entry is not None:
+                        position = Position.unpack(packed)
+                        entries[position.hash] = entry
+                        chosen[position.hash] = entry[0]
+
+                # The book side plays its chosen move, the other side anything.
+                next_frontier = {}
+                for key, position in frontier.items():
+                    if position.turn == book_side:
+                        moves = [chosen[key]] if key in chosen else []
+                    else:
+                        moves = position.legal_moves()
+                    for move in moves:
+                        child = position.copy()
+                        child.make_move(move)
+                        if child.winner() is None:
+                            next_frontier[child.hash] = child.copy()
+                frontier = next_frontier
+                if progress is not None:
+                    progress(book_side, ply + 1, len(entries))
+    return entries
+
+
+def load(path=DEFAULT_PATH):
+    """This opens the book if the file exists, or returns None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return OpeningBook(path)
+    except ValueError as error:
+        logger.warning("%s", error)
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the opening book.")
+    parser.add_argument("--plies",
+                        type=int,
+                        default=8,
+                        help="how many plies deep the book goes (default 8)")
+    parser.add_argument("--time",
+                        type=float,
+                        default=2.0,
+                        help="seconds of search per book position")
+    parser.add_argument("--max-depth", type=int, default=20)
+    parser.add_argument("--side", choices=["red", "black", "both"],
+                        default="both")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    sides = (RED, BLACK) if args.side == "both" else (args.side,)
+    start = time.perf_counter()
+    entries = build(args.plies,
+                    args.time,
+                    args.max_depth,
+                    sides,
+                    args.workers,
+                    progress=lambda side, ply, count: print(
+                        f"{side} book: ply {ply} done, {count} positions"))
+    write_book(entries, args.output)
+    print(f"Wrote {len(entries)} positions to {args.output} in "
+          f"{time.perf_counter() - start:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
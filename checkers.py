@@ -1,6 +1,20 @@
+import logging
+import math
 import tkinter as tk
 from tkinter import messagebox
-import random
+
+from engine import (BLACK, RED, Position, coords_to_square, is_capture,
+                    jumped_square, square_to_coords)
+import book
+import evaluation
+import records
+from pdn import BLACK_WINS, RED_WINS
+from render import BoardView
+import tablebase
+from search import Searcher
+from worker import SearchJob
+
+logger = logging.getLogger(__name__)
 
 
 class Checkers(tk.Tk):
@@ -27,15 +41,82 @@ class Checkers(tk.Tk):
                                       text="Change Difficulty",
                                       command=self.difficulty_selector)
         difficulty_button.pack(side="left", padx=10, pady=10)
+
+        # This creates the Move Now button, which hurries the AI along.
+        move_now_button = tk.Button(self.toolbar,
+                                    text="Move Now",
+                                    command=self.move_now)
+        move_now_button.pack(side="left", padx=10, pady=10)
+
+        # These take moves back, play them again, and start over.
+        undo_button = tk.Button(self.toolbar,
+                                text="Undo",
+                                command=self.undo_move)
+        undo_button.pack(side="left", padx=10, pady=10)
+        redo_button = tk.Button(self.toolbar,
+                                text="Redo",
+                                command=self.redo_move)
+        redo_button.pack(side="left", padx=10, pady=10)
+        new_game_button = tk.Button(self.toolbar,
+                                    text="New Game",
+                                    command=self.new_game)
+        new_game_button.pack(side="left", padx=10, pady=10)
+
+        # This shows that the AI is thinking while its search runs.
+        self.thinking_label = tk.Label(self.toolbar, text="", bg='grey')
+        self.thinking_label.pack(side="left", padx=10, pady=10)
         self.canvas = tk.Canvas(self, bg="white", height=800, width=800)
         self.canvas.pack()
         self.board_rendering()
         self.checker_placement()
+        # The endgame tablebase is used if one has been generated, and the
+        # tuned evaluation weights if tune.py has written them.
+        self.searcher = Searcher(tablebase=tablebase.load(),
+                                 evaluator=evaluation.load())
+        # Likewise the opening book, which is checked before searching.
+        self.book = book.load()
+        # The AI searches deeper until this many seconds have passed or
+        # the difficulty's depth is reached, whichever comes first.
+        self.move_time_limit = 3.0
+        # The background search for the AI's move, while one is running.
+        self.search_job = None
+        # While the human thinks, the AI searches ahead ("pondering").
+        # "predicted" searches the position after the reply the AI
+        # expects, "all" searches the human's position so every reply is
+        # in the transposition table, and None turns pondering off.
+        self.ponder_mode = "predicted"
+        self.ponder_job = None
+        # The principal variation of the AI's last search, whose second
+        # move is the predicted reply.
+        self.last_pv = []
+        # The AI's multi-jumps are shown one leg at a time, this many
+        # milliseconds apart. Zero plays the whole move at once.
+        self.animation_delay = 300
+        # This is set while the AI's move is being shown on the board.
+        self.AI_animating = False
         self.canvas.bind("<Button-1>", self.click_mechanics)
         self.selected_piece = None
-        self.current_turn = "black"
+        # The moves of each piece in the current position, worked out on
+        # the first click and reused until the position changes.
+        self.move_cache = {}
+        self.move_cache_hash = None
+        # Every whole move of the game so far, and the legs of the human's
+        # move while a multi-jump is still going on.
+        self.game_moves = []
+        self.human_move = None
+        # How deep the engine's undo stack was before each of those moves,
+        # so a move of several legs is taken back in one go.
+        self.move_marks = []
+        self.human_mark = None
+        # Moves that were taken back, most recent last, for Redo.
+        self.redo_moves = []
+        # Finished games are appended to this record file; None turns
+        # recording off.
+        self.records_path = records.DEFAULT_PATH
+        # The moves of the last game written, so that undoing the end of a
+        # game and playing it out the same way doesn't record it twice.
+        self.recorded_moves = None
         self.turn_count = 1
-        self.move_stack = []
         self.drag_data = {"x": 0, "y": 0, "piece": None}
         self.canvas.bind("<B1-Motion>", self.drag_mechanics)
         self.canvas.bind("<ButtonRelease-1>", self.drop_mechanics)
@@ -43,6 +124,11 @@ class Checkers(tk.Tk):
         self.difficulty_selector()
         self.valid_ai_moves = True
 
+    @property
+    def current_turn(self):
+        """Whose turn it is lives in the engine position."""
+        return self.position.turn
+
     def display_rules(self):
         "This displays the rules when the button is clicked."
         rules_window = tk.Toplevel(self)
@@ -80,43 +166,20 @@ class Checkers(tk.Tk):
 
     def board_rendering(self):
         """This draws the checkerboard at the beginning of the game."""
-        self.squares = {}
-        # This iterates over each square and randers it on the board.
-        for row in range(8):
-            for col in range(8):
-                x1, y1 = col * 100, row * 100
-                x2, y2 = x1 + 100, y1 + 100
-                # Alternates color on every other square.
-                color = "black" if (row + col) % 2 else "white"
-                self.squares[(row, col)] = self.canvas.create_rectangle(
-                    x1, y1, x2, y2, fill=color, tags="square")
-
-    def checker_creation(self, row, col, color):
-        """This creates every checker."""
-        x1, y1 = col * 100 + 25, row * 100 + 25
-        x2, y2 = x1 + 50, y1 + 50
-        checker_id = self.canvas.create_oval(x1,
-                                             y1,
-                                             x2,
-                                             y2,
-                                             fill=color,
-                                             tags="checker")
-        self.checkers[checker_id] = (row, col, color, False
-                                     )  # False => not a king.
+        # The view draws the squares once and afterwards only changes the
+        # canvas items that differ from the engine position.
+        self.view = BoardView(self.canvas)
 
     def checker_placement(self):
         """This places every checker on the board at the beginning."""
-        self.checkers = {}
-        # This renders the red checkers on the board.
-        for row in range(3):
-            for col in range(8):
-                if (row + col) % 2 == 1:
-                    self.checker_creation(row, col, "red")
-        # This renders the black checkers on the board.
-        for row in range(5, 8):
-            for col in range(8):
-                if (row + col) % 2 == 1:
-                    self.checker_creation(row, col, "black")
+        self.position = Position.initial()
+        # This renders the pieces of the engine's starting position.
+        self.view.sync(self.position)
+
+    def checker_color(self, square):
+        """This returns the color of the checker on a square, or None."""
+        piece = self.position.piece_at(square)
+        return piece[0] if piece is not None else None
 
     def difficulty_selector(self):
         """This controls the difficulty level of the game."""
@@ -151,19 +214,16 @@ class Checkers(tk.Tk):
         target_square = (row, col)
 
         valid_move = target_square in self.valid_moves_for_piece
+        selected_row = square_to_coords(self.selected_piece)[0]
         required_capture = (self.mandatory_capture and any(
-            abs(move[0] - self.checkers[self.selected_piece][0]) == 2
+            abs(move[0] - selected_row) == 2
             for move in self.valid_moves_for_piece))
 
         # First checks validity and then makes a capture if available.
         if valid_move and (not self.mandatory_capture or required_capture):
-            x1, y1 = col * 100 + 25, row * 100 + 25
-            self.canvas.coords(self.drag_data["piece"], x1, y1, x1 + 50,
-                               y1 + 50)
             self.checker_movement(target_square, is_subsequent_jump=False)
             self.turn_count += 1
-            self.after(500, self.AI_movement)
-            print(f"Moved piece to {target_square}.")
+            logger.debug("Moved piece to %s.", target_square)
         else:
             if self.search_for_captures(self.current_turn) == True:
                 messagebox.showinfo("Mandatory Capture",
@@ -171,13 +231,12 @@ class Checkers(tk.Tk):
             else:
                 messagebox.showinfo("Invalid Move",
                                     "You must move to a valid square!")
-            original_x, original_y = self.drag_data["original_pos"]
-            self.canvas.coords(self.drag_data["piece"], original_x, original_y,
-                               original_x + 50, original_y + 50)
-            print(f"Invalid move attempted to {target_square}, reverting.")
+            self.view.place(self.selected_piece)
+            logger.debug("Invalid move attempted to %s, reverting.",
+                         target_square)
 
         # This resets the Drag data.
-        self.drag_data = {"x": 0, "y": 0, "piece": None, "original_pos": None}
+        self.drag_data = {"x": 0, "y": 0, "piece": None}
 
     def click_mechanics(self, event):
         """This click event is triggered when the player clicks a checker."""
@@ -189,73 +248,75 @@ class Checkers(tk.Tk):
         row = event.y // 100
         clicked_square = (row, col)
         clicked_checker = self.checker_locator(row, col)
-        print("Clicked square:", clicked_square, "Checker ID:",
-              clicked_checker)
+        logger.debug("Clicked square: %s Checker ID: %s", clicked_square,
+                     clicked_checker)
+
+        clicked_color = (self.checker_color(clicked_checker)
+                         if clicked_checker is not None else None)
 
-        if clicked_checker and self.checkers[clicked_checker][
-                2] == self.current_turn:
+        # Partway through a multi-jump, only the jumping piece may move on.
+        if (self.human_move and clicked_color == self.current_turn and
+                clicked_checker != self.human_move[-1]):
+            messagebox.showwarning(
+                "Multi-Jump", "The piece that is jumping must finish the move!")
+            return
+
+        if clicked_color == self.current_turn:
             self.selected_piece = clicked_checker
-            self.drag_data["piece"] = clicked_checker
+            self.drag_data["piece"] = self.view.checkers[clicked_checker]
             self.drag_data["x"] = event.x
             self.drag_data["y"] = event.y
-            self.drag_data["original_pos"] = (col * 100 + 25, row * 100 + 25)
             self.valid_moves_for_piece = self.move_validator(clicked_checker)
             self.mandatory_capture = self.search_for_captures(
                 self.current_turn)
             self.valid_move_highlighter(clicked_checker)
 
-        if self.turn_count == 1 and clicked_checker and self.checkers[
-                clicked_checker][2] == "red":
+        if self.turn_count == 1 and clicked_color == RED:
             messagebox.showinfo("Start of Game", "Black moves first!")
-        elif clicked_checker and self.checkers[clicked_checker][
-                2] != self.current_turn:
+        elif clicked_color is not None and clicked_color != self.current_turn:
             messagebox.showwarning("Wrong Turn", "It's not your turn!")
         else:
             mandatory_capture = self.search_for_captures(self.current_turn)
-            if clicked_checker and self.checkers[clicked_checker][
-                    2] == self.current_turn:
-                if self.selected_piece:
+            if clicked_color == self.current_turn:
+                if self.selected_piece is not None:
                     possible_moves = self.move_validator(self.selected_piece)
+                    selected_row = square_to_coords(self.selected_piece)[0]
                     if clicked_square in possible_moves:
                         if mandatory_capture and not any(
-                                abs(row -
-                                    self.checkers[self.selected_piece][0]) == 2
+                                abs(row - selected_row) == 2
                                 for row, col in possible_moves):
                             messagebox.showwarning("Mandatory Jump",
                                                    "You must make a capture!")
                             self.selected_piece = None
                         else:
-                            print("Moving checker to:", clicked_square)
+                            logger.debug("Moving checker to: %s", clicked_square)
                             self.checker_movement(clicked_square,
                                               is_subsequent_jump=False)
                             self.turn_count += 1
-                            self.after(500, self.AI_movement)
                 else:
-                    print("Selecting checker:", clicked_checker)
+                    logger.debug("Selecting checker: %s", clicked_checker)
                     self.checker_selector(clicked_checker, row, col)
-            elif self.selected_piece:
+            elif self.selected_piece is not None:
                 possible_moves = self.move_validator(self.selected_piece)
+                selected_row = square_to_coords(self.selected_piece)[0]
                 if clicked_square in possible_moves:
                     if mandatory_capture and not any(
-                            abs(row -
-                                self.checkers[self.selected_piece][0]) == 2
+                            abs(row - selected_row) == 2
                             for row, _ in possible_moves):
                         messagebox.showwarning("Mandatory Jump",
                                                "You must make a capture!")
                         self.selected_piece = None
                     else:
-                        print("Moving checker to:", clicked_square)
+                        logger.debug("Moving checker to: %s", clicked_square)
                         self.checker_movement(clicked_square,
                                           is_subsequent_jump=False)
                         self.turn_count += 1
-                        self.after(500, self.AI_movement)
 
     def checker_locator(self, row, col):
-        """This searches for a checker at a specific location."""
-        for checker_id, (checker_row, checker_col, _,
-                         _) in self.checkers.items():
-            if (checker_row, checker_col) == (row, col):
-                return checker_id
+        """This returns the square of the checker at a location, or None."""
+        square = coords_to_square(row, col)
+        if square is not None and self.position.piece_at(square) is not None:
+            return square
         return None
 
     def checker_selector(self, checker_id, row, col):
@@ -267,271 +328,355 @@ class Checkers(tk.Tk):
 
     def valid_move_highlighter(self, checker_id):
         """This highlights valid moves for the player's checker."""
-        self.highlight_remover()
-        move_validator = self.move_validator(checker_id)
-        for move in move_validator:
-            row, col = move
-            self.canvas.itemconfig(self.squares[(row, col)],
-                                   outline="gold",
-                                   width=2)
+        # Squares that stay highlighted aren't touched.
+        self.view.highlight(self.move_validator(checker_id))
 
     def highlight_remover(self):
         """This removes highlights after a move is chosen."""
-        for key in self.squares:
-            self.canvas.itemconfig(self.squares[key], outline="black", width=1)
+        self.view.clear_highlights()
 
     def checker_movement(self, target_square, is_subsequent_jump=False):
         """This actually moves the checker after the player makes a choice."""
-        if self.selected_piece:
+        if self.selected_piece is not None:
 
             # Before making a move, the old position is stored.
-            old_row, old_col, color, is_king = self.checkers[
-                self.selected_piece]
-
-            # The piece is moved on the canvas.
-            row, col = target_square
-            x1, y1 = col * 100 + 25, row * 100 + 25
-            self.canvas.coords(self.selected_piece, x1, y1, x1 + 50, y1 + 50)
+            start = self.selected_piece
+            # A move of several legs is one piece's path, so no other piece
+            # can add a leg to it.
+            if self.human_move and start != self.human_move[-1]:
+                return
+            _, was_king = self.position.piece_at(start)
+            target = coords_to_square(*target_square)
+            jumped = jumped_square((start, target))
+            # Regicide ends the turn even for a king, so this is noted
+            # before the captured king leaves the board.
+            took_king = (jumped is not None and
+                         self.position.piece_at(jumped)[1])
             self.highlight_remover()
 
-            # Does this move make the piece a king?
-            becoming_king = False
-            if not is_king and ((color == "red" and row == 7) or
-                                (color == "black" and row == 0)):
-                is_king = True
-                becoming_king = True
-                self.canvas.itemconfig(self.selected_piece,
-                                       outline="gold",
-                                       width=2)
-                print(f"Piece {self.selected_piece} has been kinged.")
-
-            # Updates the position and king status in the dictionary.
-            self.checkers[self.selected_piece] = (row, col, color, is_king)
+            # The engine applies the move, including kinging and Regicide,
+            # and the canvas catches up with the squares that changed.
+            if not self.human_move:
+                # A new move replaces whatever could have been redone.
+                self.human_mark = len(self.position.move_stack)
+                self.redo_moves = []
+            captured = self.position.make_move((start, target))
+            self.view.sync(self.position)
+            self.human_move = (self.human_move + (target,)
+                               if self.human_move else (start, target))
+            self.selected_piece = target
+            _, is_king = self.position.piece_at(target)
+            becoming_king = took_king or (is_king and not was_king)
+            if is_king and not was_king:
+                logger.debug("Piece on %s has been kinged.", target_square)
 
             # Was the move a capture?
-            if abs(row - old_row) == 2 and abs(col - old_col) == 2:
-                jumped_row = (old_row + row) // 2
-                jumped_col = (old_col + col) // 2
-                jumped_piece = self.checker_locator(jumped_row, jumped_col)
-                if jumped_piece:
-                    _, _, _, jumped_is_king = self.checkers[jumped_piece]
-                    # Removes the captured piece.
-                    self.canvas.delete(jumped_piece)
-                    del self.checkers[jumped_piece]
-
-                    # Regicide: If the piece captures a king then it becomes a king.
-                    if jumped_is_king:
-                        is_king = True
-                        becoming_king = True
-                        self.canvas.itemconfig(self.selected_piece,
-                                               outline="gold",
-                                               width=2)
-                        print(
-                            f"Piece {self.selected_piece} has been kinged due to Regicide."
-                        )
-
-                    # Checks to see if another capture is possible.
-                    if not becoming_king:  # If the piece has just reached king's row, it is excluded.
-                        additional_jumps = self.additional_captures(
-                            self.selected_piece, is_subsequent_jump)
-                        if additional_jumps:
-                            self.valid_move_highlighter(self.selected_piece)
-                            print("Additional jumps available.")
-                            # Does the player want to make the second capture?
-                            if is_subsequent_jump:
-                                print(
-                                    "Player may choose to continue jumping or end their turn."
-                                )
+            if captured:
+                # Checks to see if another capture is possible.
+                if not becoming_king:  # If the piece has just been kinged, it is excluded.
+                    additional_jumps = self.additional_captures(
+                        target, is_subsequent_jump)
+                    if additional_jumps:
+                        # The mover keeps the turn while more jumps are open.
+                        self.position.switch_turn()
+                        self.valid_move_highlighter(target)
+                        logger.debug("Additional jumps available.")
+                        # Does the player want to make the second capture?
+                        if is_subsequent_jump:
+                            logger.debug(
+                                "Player may choose to continue jumping or end their turn."
+                            )
+                            return
+                        else:
+                            player_wants_to_continue = self.additional_capture_prompt(
+                            )
+                            if player_wants_to_continue:
+                                logger.debug("Player chooses to continue jumping.")
                                 return
                             else:
-                                player_wants_to_continue = self.additional_capture_prompt(
-                                )
-                                if player_wants_to_continue:
-                                    print(
-                                        "Player chooses to continue jumping.")
-                                    return
-                                else:
-                                    print("Player chooses to end their turn.")
-                                    self.highlight_remover()
-
-                        else:
-                            print("No additional jumps available.")
+                                logger.debug("Player chooses to end their turn.")
+                                self.highlight_remover()
+                                self.position.switch_turn()
 
-                    # Update the dictionary with the piece's new status.
-                    self.checkers[self.selected_piece] = (row, col, color,
-                                                          is_king)
+                    else:
+                        logger.debug("No additional jumps available.")
 
             # If there are no other captures available or the piece was just kinged, turn ends.
-            self.current_turn = "red" if self.current_turn == "black" else "black"
             # Deselects the piece after making the move.
+            self.game_moves.append(self.human_move)
+            self.move_marks.append(self.human_mark)
+            self.human_move = None
+            # This is the only place the AI is woken up after a player's move.
             self.selected_piece = None
-            if self.current_turn == "red":
+            if self.current_turn == RED:
                 self.after(500, self.AI_movement)
 
     def move_validator(self, checker_id):
-        """This is the logic for checking the validity of moves."""
-        current_row, current_col, color, is_king = self.checkers[checker_id]
-        moves = set()
-        captures = set()
-        enemy_color = "black" if color == "red" else "red"
-
-        # Movement directions determined by color and whether kinged.
-        directions = [-1, 1] if is_king else ([1] if color == "red" else [-1])
-
-        for row_diff in directions:
-            for col_diff in [-1, 1]:
-                new_row, new_col = current_row + row_diff, current_col + col_diff
-                if 0 <= new_row < 8 and 0 <= new_col < 8 and (
-                        new_row + new_col) % 2 == 1:
-                    target = self.checker_locator(new_row, new_col)
-                    if target is None:
-                        moves.add((new_row, new_col))
-                    elif self.checkers[target][2] == enemy_color:
-                        # Are captures available?
-                        jump_row, jump_col = new_row + row_diff, new_col + col_diff
-                        if 0 <= jump_row < 8 and 0 <= jump_col < 8 and (
-                                jump_row + jump_col) % 2 == 1:
-                            if self.checker_locator(jump_row,
-                                                    jump_col) is None:
-                                captures.add((jump_row, jump_col))
-
-        # If a capture is available, it is the only valid move.
-        return captures if captures else moves
+        """This returns the (row, col) squares the checker can move to.
+
+        A click asks for these several times, so they are cached for the
+        current position.
+        """
+        if self.move_cache_hash != self.position.hash:
+            self.move_cache = {}
+            self.move_cache_hash = self.position.hash
+        if checker_id not in self.move_cache:
+            self.move_cache[checker_id] = frozenset(
+                square_to_coords(end)
+                for _, end in self.position.piece_moves(checker_id))
+        return self.move_cache[checker_id]
 
     def additional_captures(self, checker_id, is_subsequent_jump=False):
         """This looks for additional captures after the player makes a capture."""
-        _, _, color, is_king = self.checkers[checker_id]
-        moves = self.move_validator(checker_id)
-        # Searches for available captures.
-        jumps = {
-            move
-            for move in moves
-            if abs(move[0] - self.checkers[checker_id][0]) == 2
+        return {
+            square_to_coords(move[1])
+            for move in self.position.piece_moves(checker_id)
+            if is_capture(move)
         }
-        return jumps
 
     def AI_movement(self):
         # Triggers first if game is over
         if self.game_over():
             return
-        if self.current_turn != "red":
-            print("Not AI's turn.")
+        if self.current_turn != RED:
+            logger.debug("Not AI's turn.")
+            return
+        if self.search_job is not None or self.AI_animating:
+            logger.debug("AI is already moving.")
             return
-        print("AI's turn to move.")
-
-        # Are there required captures for AI?
-        if self.search_for_captures("red"):
-            # Locate the first capture and execute it.
-            for checker_id, details in self.checkers.items():
-                if details[2] == 'red':
-                    move_validator = self.move_validator(checker_id)
-                    capture_moves = [
-                        move for move in move_validator
-                        if abs(move[0] - details[0]) == 2
-                    ]
-                    if capture_moves:
-                        best_move = capture_moves[0]
-                        self.checker_selector(checker_id,
-                                            *self.checkers[checker_id][:2])
-                        self.checker_movement(best_move, is_subsequent_jump=False)
-                        print(
-                            f"AI performing forced capture with piece {checker_id} to {best_move}"
-                        )
-
-                        # Are there additional captures available?
-                        additional_jumps = self.additional_captures(
-                            checker_id, False)
-                        if additional_jumps:
-                            next_jump = next(iter(additional_jumps))
-                            print("AI has additional jumps available.")
-                            self.after(
-                                1000, lambda: self.AI_capture(
-                                    checker_id, next_jump))
-                        break
+        logger.debug("AI's turn to move.")
+
+        # If the human played the predicted move, the pondering search
+        # carries on as the real one with the normal time limit.
+        if self.ponder_hit():
+            return
+        # Book and forced moves don't come with a predicted reply.
+        self.last_pv = []
+
+        # A forced move, such as the only capture, needs no search.
+        moves = self.position.legal_moves(RED)
+        if len(moves) <= 1:
+            if moves:
+                logger.debug("AI plays its only move %s", moves[0])
+            self.AI_play_move(moves[0] if moves else None)
+            return
+
+        # Well-known positions are played straight from the book.
+        book_move = self.book.probe(self.position) if self.book else None
+        if book_move:
+            logger.info("AI plays a book move.")
+            self.AI_play_move(book_move)
+            return
+
+        # Otherwise minimax is invoked in the background and polled, so
+        # the window keeps responding. Captures are whole jump sequences,
+        # so the search picks the full chain.
+        logger.debug("AI is thinking...")
+        self.thinking_label.config(text="AI is thinking...")
+        self.search_job = SearchJob(self.searcher, self.position,
+                                    self.move_time_limit, self.difficulty)
+        self.after(50, self.AI_search_poll)
+
+    def AI_search_poll(self):
+        """This checks on the background search and plays its move when done."""
+        job = self.search_job
+        if job is None:
+            return
+        if not job.finished():
+            self.after(50, self.AI_search_poll)
+            return
+        self.search_job = None
+        self.thinking_label.config(text="")
+        if job.cancelled:
+            return
+        if job.error is not None:
+            raise job.error
+
+        result = job.result
+        logger.info("AI search: %s", self.searcher.summary())
+        self.last_pv = result.pv if result else []
+        self.AI_play_move(result.move if result else None)
+
+    def AI_play_move(self, best_move):
+        """This plays the AI's chosen move, every leg of it, in one turn."""
+        if best_move:
+            logger.info("AI selected move: %s", best_move)
+            logger.debug("Turn: %s", self.turn_count)
+            self.highlight_remover()
+            self.AI_animating = True
+            # The legs are played on a copy, which the canvas follows.
+            self.AI_animate_leg(best_move, 1, self.position.copy())
         else:
-            # If no captures available, then minimax is invoked.
-            print("AI is thinking...")
-            _, best_move = self.minimax(self.difficulty, True, float('-inf'),
-                                        float('inf'))
-            if best_move:
-                selected_piece, move = best_move
-                self.checker_selector(selected_piece,
-                                    *self.checkers[selected_piece][:2])
-                self.checker_movement(move, is_subsequent_jump=False)
-                print(f"AI selected move: {move} for piece {selected_piece}")
-                print(f"Turn: {self.turn_count}")
-                print(f"AI move: {move}")
-
-                # Checks for additional captures if needed.
-                if abs(move[0] - self.checkers[selected_piece][0]) == 2:
-                    self.after(
-                        1000, lambda: self.AI_additional_captures(
-                            selected_piece, True))
-            else:
-                print("AI has no valid moves.")
-                self.valid_ai_moves = False
-                self.game_over()
-
-        print(f"AI completed its turn.")
-
-    def AI_additional_captures(self, selected_piece, is_subsequent_jump):
-        """This performs subsequent captures for the AI."""
-        if selected_piece in self.checkers:
-            additional_jumps = self.additional_captures(
-                selected_piece, is_subsequent_jump)
-            if additional_jumps:
-                print("AI has additional jumps available.")
-                next_jump = random.choice(list(additional_jumps))
-                print(f"AI preparing for additional jump to: {next_jump}")
-                self.after(
-                    1000,
-                    lambda: self.AI_capture(selected_piece, next_jump))
+            logger.debug("AI has no valid moves.")
+            self.valid_ai_moves = False
+            self.game_over()
+
+    def AI_animate_leg(self, move, leg, shown):
+        """This shows one leg of the AI's move on the canvas."""
+        shown.make_move(move[leg - 1:leg + 1])
+        self.view.sync(shown)
+
+        if leg + 1 < len(move):
+            if self.animation_delay:
+                self.after(self.animation_delay,
+                           lambda: self.AI_animate_leg(move, leg + 1, shown))
             else:
-                # No further captures? Switch turns.
-                print("No additional jumps available.")
-                self.turn_switcher()
+                self.AI_animate_leg(move, leg + 1, shown)
+            return
+
+        # The engine plays the whole move at once when the last leg is shown.
+        _, was_king = self.position.piece_at(move[0])
+        self.play_whole_move(move)
+        self.view.sync(self.position)
+        _, is_king = self.position.piece_at(move[-1])
+        if is_king and not was_king:
+            logger.debug("Piece on %s has been kinged.", move[-1])
+        self.AI_animating = False
+        self.selected_piece = None
+        logger.debug("AI completed its turn.")
+        self.start_pondering(move)
+
+    def play_whole_move(self, move):
+        """This plays a move on the engine position and adds it to the history."""
+        self.move_marks.append(len(self.position.move_stack))
+        self.position.make_move(move)
+        self.game_moves.append(move)
+
+    def take_back(self):
+        """This takes back the last whole move, one unmake per leg.
+
+        If the human is partway through a multi-jump, only the legs played
+        so far are taken back.
+        """
+        if self.human_move:
+            mark = self.human_mark
+            self.human_move = None
         else:
-            # If piece was removed, switch turns.
-            print("Selected piece no longer exists.")
-            self.turn_switcher()
-
-    def AI_capture(self, selected_piece, next_jump):
-        """This is how the AI executes captures."""
-        # Does the piece still exist?
-        if selected_piece in self.checkers:
-            self.checker_movement(next_jump, is_subsequent_jump=True)
-            # Check for additional captures.
-            self.after(
-                1000,
-                lambda: self.AI_additional_captures(selected_piece, True))
+            mark = self.move_marks.pop()
+            self.redo_moves.append(self.game_moves.pop())
+        while len(self.position.move_stack) > mark:
+            self.position.unmake_move()
+
+    def stop_searches(self):
+        """This stops the AI's search and pondering, and waits for them."""
+        for job in (self.search_job, self.ponder_job):
+            if job is not None:
+                job.cancel()
+                job.wait()
+        self.search_job = None
+        self.ponder_job = None
+        self.thinking_label.config(text="")
+
+    def refresh_board(self):
+        """This brings the board up to date after the history changes."""
+        self.view.sync(self.position)
+        self.highlight_remover()
+        self.selected_piece = None
+        self.drag_data = {"x": 0, "y": 0, "piece": None}
+        self.turn_count = len(self.game_moves) + 1
+        self.valid_ai_moves = True
+        self.last_pv = []
+
+    def undo_move(self):
+        """This takes back the human's last move and the AI's reply to it."""
+        # The AI's move is finished on the board before it can be taken back.
+        if self.AI_animating:
+            return
+        if not self.human_move and not self.game_moves:
+            return
+        self.stop_searches()
+        self.take_back()
+        # It's the human's turn again once the move they played is gone.
+        while self.game_moves and self.current_turn != BLACK:
+            self.take_back()
+        self.refresh_board()
+        logger.debug("Took back to move %s.", len(self.game_moves))
+
+    def redo_move(self):
+        """This plays taken-back moves again, up to the human's next turn."""
+        if self.AI_animating or self.human_move or not self.redo_moves:
+            return
+        self.stop_searches()
+        self.play_whole_move(self.redo_moves.pop())
+        while self.redo_moves and self.current_turn != BLACK:
+            self.play_whole_move(self.redo_moves.pop())
+        self.refresh_board()
+        # With nothing left to redo, the AI answers the human's move itself.
+        if self.current_turn == RED:
+            self.after(500, self.AI_movement)
+
+    def new_game(self):
+        """This starts again from the opening position in the same window."""
+        if self.AI_animating:
+            return
+        self.stop_searches()
+        self.checker_placement()
+        self.game_moves = []
+        self.move_marks = []
+        self.human_move = None
+        self.redo_moves = []
+        self.recorded_moves = None
+        self.refresh_board()
+        logger.info("New game.")
+
+    def start_pondering(self, played):
+        """This starts searching in the background during the human's turn."""
+        if self.ponder_mode is None or self.position.winner() is not None:
+            return
+        position = self.position.copy()
+        # The search's predicted line continues from the move just played.
+        pv = self.last_pv
+        if (self.ponder_mode == "predicted" and len(pv) > 1 and
+                pv[0] == played and pv[1] in position.legal_moves()):
+            position.make_move(pv[1])
+            if position.winner() is not None:
+                return
+            logger.debug("AI is pondering on the reply %s.", pv[1])
         else:
-            print("Jumping piece has been removed.")
-            self.turn_switcher()
+            logger.debug("AI is pondering on every reply.")
+        # Pondering has no time limit; it stops at the difficulty's depth,
+        # when the human moves, or becomes the real search on a hit.
+        self.ponder_job = SearchJob(self.searcher, position, math.inf,
+                                    self.difficulty)
+
+    def ponder_hit(self):
+        """This reuses the pondering search if the human made the predicted move.
+
+        Otherwise the pondering search is stopped; what it stored in the
+        transposition table still helps the real search.
+        """
+        job = self.ponder_job
+        self.ponder_job = None
+        if job is None:
+            return False
+        if job.root_hash != self.position.hash:
+            job.cancel()
+            job.wait()
+            return False
+        logger.info("AI predicted the move and was already searching.")
+        job.ponder_hit(self.move_time_limit)
+        self.search_job = job
+        self.thinking_label.config(text="AI is thinking...")
+        self.AI_search_poll()
+        return True
+
+    def move_now(self):
+        """This makes the AI play the best move it has found so far."""
+        if self.search_job is not None:
+            self.search_job.move_now()
 
     def search_for_captures(self, color):
         """This determines is captures are open for the chosen checker."""
-        for checker_id, details in self.checkers.items():
-            if details[2] == color:
-                moves = self.move_validator(checker_id)
-                # Check if any capture moves are available.
-                for move in moves:
-                    current_row, _ = self.checkers[checker_id][:2]
-                    if abs(move[0] - current_row) == 2:
-                        return True
-        return False
+        return self.position.has_captures(color)
 
     def search_for_valid_moves(self, color):
         """This checks to see if any valid moves exist for the chosen checker."""
-        for checker_id, details in self.checkers.items():
-            if details[2] == color:
-                if self.move_validator(checker_id):
-                    return True
-        return False
+        return bool(self.position.legal_moves(color))
 
     def additional_capture_prompt(self):
         """This prompts the player to make a second jump if one is available."""
         # AI will automatically continue jumping.
-        if self.current_turn == "red":
+        if self.current_turn == RED:
             return True
         else:
             response = messagebox.askyesno(
@@ -540,138 +685,40 @@ class Checkers(tk.Tk):
 
             return response
 
-    def minimax(self, depth, maximizing_player, alpha, beta):
-        """This is the minimax algorithm with alpha-beta pruning."""
-        if depth == 0 or self.game_over():
-            return self.evaluation_function(), None
-
-        if maximizing_player:
-            max_eval = float('-inf')
-            best_move = None
-            successors = self.successor_function("red")
-            for checker_id, move in successors:
-                self.simulation(checker_id, move)
-                eval, _ = self.minimax(depth - 1, False, alpha, beta)
-                self.clear_simulation()
-                if eval > max_eval:
-                    max_eval = eval
-                    best_move = (checker_id, move)
-                alpha = max(alpha, eval)
-                if beta <= alpha:
-                    break
-            return max_eval, best_move
-        else:
-            min_eval = float('inf')
-            best_move = None
-            successors = self.successor_function("black")
-            for checker_id, move in successors:
-                self.simulation(checker_id, move)
-                eval, _ = self.minimax(depth - 1, True, alpha, beta)
-                self.clear_simulation()
-                if eval < min_eval:
-                    min_eval = eval
-                    best_move = (checker_id, move)
-                beta = min(beta, eval)
-                if beta <= alpha:
-                    break
-            return min_eval, best_move
-
-    def successor_function(self, color):
-        """This is the successor function for minimax."""
-        print("Generating successors for color:", color)
-        successors = []
-        for checker_id in self.checkers:
-            if self.checkers[checker_id][2] == color:
-                move_validator = self.move_validator(checker_id)
-                for move in move_validator:
-                    successors.append((checker_id, move))
-        return successors
-
-    def simulation(self, checker_id, target_square):
-        """Evaluates potential moves by simulating the movement of checkers."""
-        print("Simulating move for checker:", checker_id, "to", target_square)
-        if checker_id:
-            old_row, old_col, color, is_king = self.checkers[checker_id]
-            new_row, new_col = target_square
-
-            # Adds original state onto stack, then changes.
-            self.move_stack.append(
-                (checker_id, (old_row, old_col, color, is_king)))
-
-            # Updates the position and king status of the piece.
-            becoming_king = not is_king and (
-                (color == "red" and new_row == 7) or
-                (color == "black" and new_row == 0))
-            if becoming_king:
-                is_king = True
-
-            self.checkers[checker_id] = (new_row, new_col, color, is_king)
-
-            # Implements the capturing.
-            if abs(new_row - old_row) == 2 and abs(new_col - old_col) == 2:
-                jumped_row = (old_row + new_row) // 2
-                jumped_col = (old_col + new_col) // 2
-                jumped_piece = self.checker_locator(jumped_row, jumped_col)
-                if jumped_piece:
-                    self.move_stack.append(
-                        (jumped_piece, self.checkers[jumped_piece]))
-                    del self.checkers[jumped_piece]
-
-    def clear_simulation(self):
-        """Erases the moves after they are made in the simulation."""
-        print("Undoing move")
-        while self.move_stack:
-            checker_id, old_state = self.move_stack.pop()
-            self.checkers[checker_id] = old_state
-
-    def evaluation_function(self):
-        """Evaluates the board by counting piece difference."""
-        print("Evaluating board")
-        # A basic evaluation based on counting the pieces.
-        red_pieces = sum(1 for piece in self.checkers.values()
-                            if piece[2] == "red")
-        black_pieces = sum(1 for piece in self.checkers.values()
-                            if piece[2] == "black")
-        return red_pieces - black_pieces  
-
-    def find_every_move(self, color):
-        """Produces a list of every move that is valid for the given player."""
-        print("Getting all moves for color:", color)
-        move_validator = {}
-        for checker_id, details in self.checkers.items():
-            if details[2] == color:
-                moves = self.move_validator(checker_id)
-                if moves:
-                    move_validator[checker_id] = moves
-        return move_validator
-
-    def turn_switcher(self):
-        self.current_turn = "red" if self.current_turn == "black" else "black"
-        self.selected_piece = None
-        if self.current_turn == "red":
-            self.after(500, self.AI_movement)
-        print(f"Turn switched to {self.current_turn}.")
-
     def game_over(self):
-        # Sums remaining pieces for each color.
-        red_pieces = sum(1 for piece in self.checkers.values()
-                         if piece[2] == "red")
-        black_pieces = sum(1 for piece in self.checkers.values()
-                           if piece[2] == "black")
+        # Counts remaining pieces for each color.
+        red_pieces = self.position.count(RED)
+        black_pieces = self.position.count(BLACK)
 
         # Should the game end?
         if red_pieces == 0:
+            self.record_game(BLACK_WINS)
             messagebox.showinfo("Game Over", "Black wins!")
             return True
         elif black_pieces == 0:
+            self.record_game(RED_WINS)
             messagebox.showinfo("Game Over", "Red wins!")
             return True
         elif self.valid_ai_moves == False:
+            self.record_game(BLACK_WINS)
             messagebox.showinfo("Game Over",
                                 "Game over! AI has no valid moves.")
             return True
         return False
 
+    def record_game(self, result):
+        """This appends the finished game to the game records, once."""
+        moves = tuple(self.game_moves)
+        if moves == self.recorded_moves or self.records_path is None:
+            return
+        self.recorded_moves = moves
+        try:
+            with records.GameWriter(self.records_path) as writer:
+                writer.append(self.game_moves, result)
+            logger.info("Game recorded in %s.", self.records_path)
+        except (OSError, ValueError) as error:
+            logger.warning("The game could not be recorded: %s", error)
+
 
 class difficulty_window(tk.Toplevel):
     """This class is needed for rendering the difficulty selection dialogue box."""
@@ -706,5 +753,6 @@ class difficulty_window(tk.Toplevel):
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     game = Checkers()
     game.mainloop()
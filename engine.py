@@ -0,0 +1,513 @@
+"""This is the Tk-free rules engine shared by the GUI and the search.
+
+Only the 32 dark squares are playable, so they are numbered 0-31 from the
+top-left of the board (Red's side) to the bottom-right (Black's side):
+square = row * 4 + col // 2. Red moves down the board and Black moves up.
+
+A position is stored as bitboards: bit n of a mask is set when square n
+holds a piece of that kind, so move generation, capture detection and
+piece counting are a handful of shifts and ANDs.
+
+A move is a tuple of squares: (from, to) for a plain move or a single
+jump, and (from, landing, landing, ...) for a multi-jump, which is played
+as one move. A jump sequence ends when the piece runs out of jumps, when a
+man reaches the king's row, or when any piece captures a king (Regicide).
+"""
+
+import random
+
+RED = "red"
+BLACK = "black"
+
+# Diagonal directions as (row step, col step).
+UP_LEFT, UP_RIGHT, DOWN_LEFT, DOWN_RIGHT = range(4)
+DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+ALL_DIRECTIONS = tuple(range(len(DIRECTIONS)))
+
+# Men only move forwards; kings also use the other color's directions.
+FORWARD = {RED: (DOWN_LEFT, DOWN_RIGHT), BLACK: (UP_LEFT, UP_RIGHT)}
+
+FULL_BOARD = 0xFFFFFFFF
+RED_KING_ROW = 0xF0000000  # Row 7, where Red pieces are crowned.
+BLACK_KING_ROW = 0x0000000F  # Row 0, where Black pieces are crowned.
+
+
+def opponent(color):
+    """This returns the color of the other player."""
+    return BLACK if color == RED else RED
+
+
+def square_to_coords(square):
+    """This converts a square number into a (row, col) pair on the 8x8 board."""
+    row = square // 4
+    col = 2 * (square % 4) + (1 if row % 2 == 0 else 0)
+    return row, col
+
+
+def coords_to_square(row, col):
+    """This converts (row, col) into a square number, or None if it isn't playable."""
+    if 0 <= row < 8 and 0 <= col < 8 and (row + col) % 2 == 1:
+        return row * 4 + col // 2
+    return None
+
+
+def _build_tables():
+    """This precomputes the neighbour and jump tables for every square."""
+    neighbours = [[-1] * 32 for _ in DIRECTIONS]
+    jumps = [[-1] * 32 for _ in DIRECTIONS]
+    for square in range(32):
+        row, col = square_to_coords(square)
+        for direction, (row_diff, col_diff) in enumerate(DIRECTIONS):
+            step = coords_to_square(row + row_diff, col + col_diff)
+            landing = coords_to_square(row + 2 * row_diff, col + 2 * col_diff)
+            neighbours[direction][square] = -1 if step is None else step
+            if step is not None and landing is not None:
+                jumps[direction][square] = landing
+    return neighbours, jumps
+
+
+NEIGHBOURS, JUMPS = _build_tables()
+
+
+def _build_move_tables():
+    """This precomputes a shared tuple for every (from, to) pair, and the
+    square each single jump jumps over.
+
+    Both are indexed by from * 32 + to, so a plain move or a single jump
+    is a small integer until a tuple is needed, and then it is always the
+    same tuple rather than a new one.
+    """
+    pairs = tuple((start, end) for start in range(32) for end in range(32))
+    jumped = [-1] * 1024
+    for direction in range(len(DIRECTIONS)):
+        for square in range(32):
+            landing = JUMPS[direction][square]
+            if landing >= 0:
+                jumped[square * 32 + landing] = NEIGHBOURS[direction][square]
+    return pairs, tuple(jumped)
+
+
+MOVE_PAIRS, JUMPED = _build_move_tables()
+
+
+def _build_shift_groups():
+    """This groups squares by how far their bit moves in each direction.
+
+    The step between neighbouring squares depends on the parity of the row,
+    so each direction is a short list of (mask, offset) pairs. Shifting the
+    masked bits by the offset moves every piece one step at once.
+    """
+    step_groups = []
+    jump_groups = []
+    for direction in range(len(DIRECTIONS)):
+        steps = {}
+        jumps = {}
+        for square in range(32):
+            step = NEIGHBOURS[direction][square]
+            if step >= 0:
+                steps[step - square] = steps.get(step - square, 0) | 1 << square
+            landing = JUMPS[direction][square]
+            if landing >= 0:
+                key = (step - square, landing - step)
+                jumps[key] = jumps.get(key, 0) | 1 << square
+        step_groups.append(tuple(
+            (mask, offset) for offset, mask in sorted(steps.items())))
+        jump_groups.append(tuple(
+            (mask, over, land) for (over, land), mask in sorted(jumps.items())))
+    return tuple(step_groups), tuple(jump_groups)
+
+
+STEP_GROUPS, JUMP_GROUPS = _build_shift_groups()
+
+# Zobrist keys, indexed [piece kind][square]. The kinds are Red man, Red
+# king, Black man and Black king. The seed is fixed so a position hashes
+# the same way in every process.
+RED_MAN, RED_KING, BLACK_MAN, BLACK_KING = range(4)
+_zobrist_random = random.Random(20240501)
+ZOBRIST = tuple(
+    tuple(_zobrist_random.getrandbits(64) for _ in range(32))
+    for _ in range(4))
+ZOBRIST_RED_TO_MOVE = _zobrist_random.getrandbits(64)
+
+# Evaluation weights. Scores are from Red's point of view, in hundredths
+# of a man.
+MAN_VALUE = 100
+KING_VALUE = 130
+ADVANCE_BONUS = 2  # Per row a man has moved towards the king's row.
+BACK_ROW_BONUS = 5  # For a man still guarding its own king's row.
+CENTRE_BONUS = 5  # For a king on one of the eight central squares.
+CENTRE = 0x00666600  # The central squares, rows 2-5.
+
+
+def _build_piece_square_tables():
+    """This works out what each kind of piece is worth on each square."""
+    tables = [[0] * 32 for _ in range(4)]
+    for square in range(32):
+        row = square // 4
+        centre = CENTRE_BONUS if CENTRE >> square & 1 else 0
+        tables[RED_MAN][square] = MAN_VALUE + ADVANCE_BONUS * row + (
+            BACK_ROW_BONUS if row == 0 else 0)
+        tables[BLACK_MAN][square] = -(MAN_VALUE + ADVANCE_BONUS * (7 - row) +
+                                      (BACK_ROW_BONUS if row == 7 else 0))
+        tables[RED_KING][square] = KING_VALUE + centre
+        tables[BLACK_KING][square] = -(KING_VALUE + centre)
+    return tuple(tuple(table) for table in tables)
+
+
+# Indexed [piece kind][square], like the Zobrist keys.
+PIECE_SQUARE = _build_piece_square_tables()
+
+
+def _shift(bits, offset):
+    """This moves every set bit by offset squares."""
+    return bits << offset if offset > 0 else bits >> -offset
+
+
+def _squares_of(bits):
+    """This yields the square number of every set bit, lowest first."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def is_capture(move):
+    """This checks whether a move jumps over a piece."""
+    return abs(move[1] // 4 - move[0] // 4) == 2
+
+
+def jumped_square(move):
+    """This returns the square a single (from, to) jump jumps over."""
+    square = JUMPED[move[0] * 32 + move[1]]
+    return square if square >= 0 else None
+
+
+def captured_squares(move):
+    """This returns the squares a move captures on, in order."""
+    if not is_capture(move):
+        return ()
+    if len(move) == 2:
+        return (JUMPED[move[0] * 32 + move[1]],)
+    return tuple(JUMPED[move[index] * 32 + move[index + 1]]
+                 for index in range(len(move) - 1))
+
+
+class Position:
+    """This is a compact checkers position: the pieces and the side to move."""
+
+    # The search makes and unmakes moves on one Position millions of
+    # times, so it has fixed slots rather than an attribute dict.
+    __slots__ = ("red", "black", "kings", "turn", "hash", "score",
+                 "move_stack")
+
+    def __init__(self, red=0, black=0, kings=0, turn=BLACK):
+        # Bit n of each mask stands for square n.
+        self.red = red
+        self.black = black
+        self.kings = kings
+        self.turn = turn
+        self.hash = self.compute_hash()
+        self.score = self.compute_score()
+        self.move_stack = []
+
+    @classmethod
+    def initial(cls):
+        """This sets up the starting position, with Black to move first."""
+        return cls(red=0x00000FFF, black=0xFFF00000, kings=0, turn=BLACK)
+
+    def copy(self):
+        """This returns an independent copy without the undo history."""
+        return Position(self.red, self.black, self.kings, self.turn)
+
+    def pack(self):
+        """This returns the position as a small tuple of ints for other processes."""
+        return (self.red, self.black, self.kings, 1 if self.turn == RED else 0)
+
+    @classmethod
+    def unpack(cls, data):
+        """This rebuilds a position from the tuple made by pack()."""
+        red, black, kings, red_to_move = data
+        return cls(red, black, kings, RED if red_to_move else BLACK)
+
+    def compute_hash(self):
+        """This computes the Zobrist hash of the position from scratch."""
+        key = ZOBRIST_RED_TO_MOVE if self.turn == RED else 0
+        for square in _squares_of(self.red):
+            kind = RED_KING if self.kings >> square & 1 else RED_MAN
+            key ^= ZOBRIST[kind][square]
+        for square in _squares_of(self.black):
+            kind = BLACK_KING if self.kings >> square & 1 else BLACK_MAN
+            key ^= ZOBRIST[kind][square]
+        return key
+
+    def compute_score(self):
+        """This adds up the material and piece-square terms from scratch."""
+        score = 0
+        for square in _squares_of(self.red):
+            kind = RED_KING if self.kings >> square & 1 else RED_MAN
+            score += PIECE_SQUARE[kind][square]
+        for square in _squares_of(self.black):
+            kind = BLACK_KING if self.kings >> square & 1 else BLACK_MAN
+            score += PIECE_SQUARE[kind][square]
+        return score
+
+    def pieces_of(self, color):
+        """This returns the bitboard of the given color's pieces."""
+        return self.red if color == RED else self.black
+
+    def piece_at(self, square):
+        """This returns (color, is_king) for the square, or None if it is empty."""
+        bit = 1 << square
+        if self.red & bit:
+            return RED, bool(self.kings & bit)
+        if self.black & bit:
+            return BLACK, bool(self.kings & bit)
+        return None
+
+    def squares(self, color):
+        """This lists every square holding a piece of the given color."""
+        return list(_squares_of(self.pieces_of(color)))
+
+    def count(self, color):
+        """This counts the pieces of the given color."""
+        return self.pieces_of(color).bit_count()
+
+    def piece_moves(self, square):
+        """This returns the moves for one piece. Captures replace plain moves."""
+        color, is_king = self.piece_at(square)
+        empty = ~(self.red | self.black) & FULL_BOARD
+        enemies = self.pieces_of(opponent(color))
+        moves = []
+        captures = []
+
+        # Movement directions determined by color and whether kinged.
+        directions = range(len(DIRECTIONS)) if is_king else FORWARD[color]
+
+        for direction in directions:
+            step = NEIGHBOURS[direction][square]
+            if step < 0:
+                continue
+            if empty >> step & 1:
+                moves.append((square, step))
+            elif enemies >> step & 1:
+                landing = JUMPS[direction][square]
+                if landing >= 0 and empty >> landing & 1:
+                    captures.append((square, landing))
+
+        return captures if captures else moves
+
+    def _movers(self, color):
+        """This yields (direction, pieces) for every direction a side can move in."""
+        pieces = self.pieces_of(color)
+        kings = pieces & self.kings
+        forward = FORWARD[color]
+        for direction in ALL_DIRECTIONS:
+            movers = pieces if direction in forward else kings
+            if movers:
+                yield direction, movers
+
+    def captures(self, color=None):
+        """This lists every complete jump sequence open to the given color."""
+        color = color or self.turn
+        pieces = self.red if color == RED else self.black
+        enemies = self.black if color == RED else self.red
+        empty = ~(self.red | self.black) & FULL_BOARD
+        kings = pieces & self.kings
+        forward = FORWARD[color]
+        king_row = RED_KING_ROW if color == RED else BLACK_KING_ROW
+        captures = []
+        # The loops below are written out in full, without helpers or
+        # generators, because this runs at nearly every node.
+        for direction in ALL_DIRECTIONS:
+            movers = pieces if direction in forward else kings
+            if not movers:
+                continue
+            for mask, over, land in JUMP_GROUPS[direction]:
+                if over > 0:
+                    landings = ((movers & mask) << over & enemies) << land
+                else:
+                    landings = ((movers & mask) >> -over & enemies) >> -land
+                landings &= empty
+                while landings:
+                    low = landings & -landings
+                    landings ^= low
+                    landing = low.bit_length() - 1
+                    start = landing - land - over
+                    self._continue_jump(MOVE_PAIRS[start * 32 + landing],
+                                        start + over, color,
+                                        self.kings >> start & 1, enemies,
+                                        empty | 1 << start, king_row,
+                                        captures)
+        return captures
+
+    def _continue_jump(self, path, jumped, color, is_king, enemies, empty,
+                       king_row, captures):
+        """This follows a jump sequence from its latest leg to every ending.
+
+        The captured piece comes off the board straight away, so it can't
+        be jumped twice, and the square the piece left counts as empty.
+        """
+        square = path[-1]
+        # Taking a king ends the turn (Regicide), whatever made the capture,
+        # and so does a man reaching the king's row.
+        if self.kings >> jumped & 1 or not is_king and king_row >> square & 1:
+            captures.append(path)
+            return
+        enemies &= ~(1 << jumped)
+        empty = (empty | 1 << jumped) & ~(1 << square)
+        directions = ALL_DIRECTIONS if is_king else FORWARD[color]
+        extended = False
+        for direction in directions:
+            step = NEIGHBOURS[direction][square]
+            landing = JUMPS[direction][square]
+            if landing >= 0 and enemies >> step & 1 and empty >> landing & 1:
+                self._continue_jump(path + (landing,), step, color, is_king,
+                                    enemies, empty, king_row, captures)
+                extended = True
+        if not extended:
+            captures.append(path)
+
+    def has_captures(self, color=None):
+        """This checks whether the given color has a capture available."""
+        color = color or self.turn
+        pieces = self.red if color == RED else self.black
+        enemies = self.black if color == RED else self.red
+        empty = ~(self.red | self.black) & FULL_BOARD
+        kings = pieces & self.kings
+        forward = FORWARD[color]
+        for direction in ALL_DIRECTIONS:
+            movers = pieces if direction in forward else kings
+            if not movers:
+                continue
+            for mask, over, land in JUMP_GROUPS[direction]:
+                if over > 0:
+                    landings = ((movers & mask) << over & enemies) << land
+                else:
+                    landings = ((movers & mask) >> -over & enemies) >> -land
+                if landings & empty:
+                    return True
+        return False
+
+    def simple_moves(self, color=None):
+        """This lists every non-capturing move available to the given color."""
+        color = color or self.turn
+        pieces = self.red if color == RED else self.black
+        empty = ~(self.red | self.black) & FULL_BOARD
+        kings = pieces & self.kings
+        forward = FORWARD[color]
+        moves = []
+        for direction in ALL_DIRECTIONS:
+            movers = pieces if direction in forward else kings
+            if not movers:
+                continue
+            for mask, offset in STEP_GROUPS[direction]:
+                if offset > 0:
+                    targets = (movers & mask) << offset & empty
+                else:
+                    targets = (movers & mask) >> -offset & empty
+                while targets:
+                    low = targets & -targets
+                    targets ^= low
+                    target = low.bit_length() - 1
+                    moves.append(MOVE_PAIRS[(target - offset) * 32 + target])
+        return moves
+
+    def legal_moves(self, color=None):
+        """This lists the legal moves for a color. Captures are mandatory."""
+        return self.captures(color) or self.simple_moves(color)
+
+    def mobility(self, color=None):
+        """This counts the plain moves the given color's pieces could make."""
+        color = color or self.turn
+        empty = ~(self.red | self.black) & FULL_BOARD
+        count = 0
+        for direction, movers in self._movers(color):
+            for mask, offset in STEP_GROUPS[direction]:
+                count += (_shift(movers & mask, offset) & empty).bit_count()
+        return count
+
+    def has_moves(self, color=None):
+        """This checks whether the given color can move at all."""
+        color = color or self.turn
+        empty = ~(self.red | self.black) & FULL_BOARD
+        for direction, movers in self._movers(color):
+            for mask, offset in STEP_GROUPS[direction]:
+                if _shift(movers & mask, offset) & empty:
+                    return True
+        return self.has_captures(color)
+
+    def make_move(self, move):
+        """This plays a move, including every leg of a multi-jump, in one go.
+
+        It returns the captured squares, which is empty for a plain move.
+        """
+        start = move[0]
+        end = move[-1]
+        start_bit = 1 << start
+        end_bit = 1 << end
+
+        # Adds the original state onto the stack, then changes it.
+        self.move_stack.append((self.red, self.black, self.kings, self.turn,
+                                self.hash, self.score))
+
+        # The hash and score are updated piece by piece rather than recomputed.
+        is_red = self.red & start_bit
+        was_king = self.kings & start_bit
+        kind = (RED_KING if was_king else RED_MAN) if is_red else (
+            BLACK_KING if was_king else BLACK_MAN)
+        key = self.hash ^ ZOBRIST[kind][start] ^ ZOBRIST_RED_TO_MOVE
+        score = self.score - PIECE_SQUARE[kind][start]
+
+        captured = captured_squares(move)
+        for square in captured:
+            captured_bit = 1 << square
+            captured_king = self.kings & captured_bit
+            if is_red:
+                captured_kind = BLACK_KING if captured_king else BLACK_MAN
+            else:
+                captured_kind = RED_KING if captured_king else RED_MAN
+            key ^= ZOBRIST[captured_kind][square]
+            score -= PIECE_SQUARE[captured_kind][square]
+            # Regicide: capturing a king crowns the capturing piece.
+            if captured_king:
+                self.kings |= start_bit
+            self.red &= ~captured_bit
+            self.black &= ~captured_bit
+            self.kings &= ~captured_bit
+
+        # A king's jump sequence can end on the square it started from.
+        if is_red:
+            self.red = self.red & ~start_bit | end_bit
+            crowned = end_bit & RED_KING_ROW
+        else:
+            self.black = self.black & ~start_bit | end_bit
+            crowned = end_bit & BLACK_KING_ROW
+        if self.kings & start_bit or crowned:
+            self.kings = (self.kings & ~start_bit) | end_bit
+            kind = RED_KING if is_red else BLACK_KING
+
+        self.hash = key ^ ZOBRIST[kind][end]
+        self.score = score + PIECE_SQUARE[kind][end]
+        self.turn = opponent(self.turn)
+        return captured
+
+    def unmake_move(self):
+        """This takes back the most recent move."""
+        (self.red, self.black, self.kings, self.turn, self.hash,
+         self.score) = self.move_stack.pop()
+
+    def switch_turn(self):
+        """This hands the turn over without moving, e.g. between jump legs."""
+        self.turn = opponent(self.turn)
+        self.hash ^= ZOBRIST_RED_TO_MOVE
+
+    def winner(self):
+        """This returns the winning color, or None if the game isn't over."""
+        if not self.red:
+            return BLACK
+        if not self.black:
+            return RED
+        # A player who is unable to make a valid move loses.
+        if not self.has_moves():
+            return opponent(self.turn)
+        return None
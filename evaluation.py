@@ -0,0 +1,191 @@
+"""This is the weighted evaluation, for single positions and in batches.
+
+The score is a weighted sum of features, each counted for Red minus
+Black: men, kings, how far the men have advanced, men still guarding the
+back row, kings and men on the central squares, and mobility (plain moves
+available). With DEFAULT_WEIGHTS it gives the same score the position
+keeps up to date in make_move, so it can be swapped in for it.
+
+NumPy is optional. With it, evaluate() turns a batch of positions into
+board planes and scores them all with a few array operations; without
+it, evaluate() scores them one at a time.
+
+Tuned weights are kept in a small JSON file (see tune.py), which load()
+reads at startup.
+"""
+
+import json
+import logging
+import os
+
+from engine import (ADVANCE_BONUS, BACK_ROW_BONUS, BLACK, CENTRE, CENTRE_BONUS,
+                    DIRECTIONS, FORWARD, KING_VALUE, MAN_VALUE, NEIGHBOURS,
+                    RED, Position)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# The order of the features in feature vectors and weight vectors.
+FEATURES = ("men", "kings", "advance", "back_row", "centre_kings",
+            "centre_men", "mobility")
+
+# These match the engine's piece-square tables. The last two are new
+# features that start switched off until they are tuned.
+DEFAULT_WEIGHTS = {
+    "men": MAN_VALUE,
+    "kings": KING_VALUE,
+    "advance": ADVANCE_BONUS,
+    "back_row": BACK_ROW_BONUS,
+    "centre_kings": CENTRE_BONUS,
+    "centre_men": 0,
+    "mobility": 0,
+}
+
+# Bumped whenever the features change, so old weight files are ignored.
+WEIGHTS_VERSION = 1
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "weights.json")
+
+RED_BACK_ROW = 0x0000000F  # Row 0, which Red's men guard.
+BLACK_BACK_ROW = 0xF0000000  # Row 7, which Black's men guard.
+
+
+def _advance(bits, red):
+    """This adds up how many rows each man has moved forward."""
+    total = 0
+    while bits:
+        low = bits & -bits
+        row = (low.bit_length() - 1) // 4
+        total += row if red else 7 - row
+        bits ^= low
+    return total
+
+
+def features(position):
+    """This returns the feature vector of one position as a list."""
+    red_men = position.red & ~position.kings
+    red_kings = position.red & position.kings
+    black_men = position.black & ~position.kings
+    black_kings = position.black & position.kings
+    return [
+        red_men.bit_count() - black_men.bit_count(),
+        red_kings.bit_count() - black_kings.bit_count(),
+        _advance(red_men, True) - _advance(black_men, False),
+        (red_men & RED_BACK_ROW).bit_count() -
+        (black_men & BLACK_BACK_ROW).bit_count(),
+        (red_kings & CENTRE).bit_count() - (black_kings & CENTRE).bit_count(),
+        (red_men & CENTRE).bit_count() - (black_men & CENTRE).bit_count(),
+        position.mobility(RED) - position.mobility(BLACK),
+    ]
+
+
+if np is not None:
+    _BITS = np.arange(32, dtype=np.uint64)
+    _ROWS = np.arange(32) // 4
+    _CENTRE = (CENTRE >> np.arange(32)) & 1
+    # Neighbour indexes, with off-board neighbours pointing at a padding
+    # column that is never empty.
+    _NEIGHBOURS = np.array([[step if step >= 0 else 32 for step in steps]
+                            for steps in NEIGHBOURS])
+
+
+def board_planes(boards):
+    """This turns (red, black, kings, ...) tuples into an (N, 4, 32) array.
+
+    The planes are Red men, Red kings, Black men and Black kings, with a 1
+    on every square that holds that kind of piece.
+    """
+    boards = np.array([board[:3] for board in boards],
+                      dtype=np.uint64).reshape(-1, 3)
+    red, black, kings = boards[:, 0], boards[:, 1], boards[:, 2]
+    kinds = np.stack([red & ~kings, red & kings, black & ~kings,
+                      black & kings], axis=1)
+    return ((kinds[:, :, None] >> _BITS) & np.uint64(1)).astype(np.int32)
+
+
+def batch_features(planes):
+    """This returns the (N, features) matrix for a batch of board planes."""
+    red_men, red_kings, black_men, black_kings = (planes[:, index]
+                                                  for index in range(4))
+    occupied = planes.sum(axis=1)
+    empty = np.concatenate(
+        [1 - occupied, np.zeros((len(planes), 1), dtype=occupied.dtype)],
+        axis=1)
+    mobility = np.zeros(len(planes), dtype=np.int64)
+    for direction in range(len(DIRECTIONS)):
+        open_step = empty[:, _NEIGHBOURS[direction]]
+        red_movers = (red_men + red_kings if direction in FORWARD[RED] else
+                      red_kings)
+        black_movers = (black_men + black_kings
+                        if direction in FORWARD[BLACK] else black_kings)
+        mobility += ((red_movers - black_movers) * open_step).sum(axis=1)
+    return np.stack([
+        red_men.sum(axis=1) - black_men.sum(axis=1),
+        red_kings.sum(axis=1) - black_kings.sum(axis=1),
+        red_men @ _ROWS - black_men @ (7 - _ROWS),
+        red_men[:, 0:4].sum(axis=1) - black_men[:, 28:32].sum(axis=1),
+        (red_kings - black_kings) @ _CENTRE,
+        (red_men - black_men) @ _CENTRE,
+        mobility,
+    ], axis=1)
+
+
+class Evaluator:
+    """This scores positions as a weighted sum of features, from Red's side."""
+
+    def __init__(self, weights=None):
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights:
+            unknown = set(weights) - set(FEATURES)
+            if unknown:
+                raise ValueError(f"Unknown evaluation features: {unknown}")
+            self.weights.update(weights)
+        self.vector = [self.weights[name] for name in FEATURES]
+
+    @property
+    def batched(self):
+        """Batches are only vectorized when NumPy is installed."""
+        return np is not None
+
+    def score(self, position):
+        """This scores a single position."""
+        return sum(weight * value
+                   for weight, value in zip(self.vector, features(position)))
+
+    def evaluate(self, boards):
+        """This scores a batch of positions given as packed tuples.
+
+        Each board is (red, black, kings, ...), as Position.pack() gives.
+        """
+        if not self.batched:
+            return [self.score(Position.unpack(board)) for board in boards]
+        if not boards:
+            return []
+        scores = batch_features(board_planes(boards)) @ np.array(self.vector)
+        return scores.tolist()
+
+
+def save_weights(weights, path=DEFAULT_PATH, **info):
+    """This writes a weight file, with any extra info about the tuning run."""
+    with open(path, "w") as handle:
+        json.dump({"version": WEIGHTS_VERSION, "features": list(FEATURES),
+                   "weights": weights, **info}, handle, indent=2)
+        handle.write("\n")
+    return path
+
+
+def load(path=DEFAULT_PATH):
+    """This returns an Evaluator for a weight file, or None if there isn't one."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as handle:
+        data = json.load(handle)
+    if data.get("version") != WEIGHTS_VERSION:
+        logger.warning("%s is not a version %s weight file; please tune again.",
+                       path, WEIGHTS_VERSION)
+        return None
+    return Evaluator(data["weights"])
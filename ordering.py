@@ -0,0 +1,98 @@
+"""This orders moves so alpha-beta pruning cuts off as early as possible."""
+
+from engine import (BLACK, BLACK_KING_ROW, RED, RED_KING_ROW, captured_squares,
+                    is_capture)
+
+# Sort keys for each class of move. Anything below KILLER_SCORE comes from
+# the history table.
+PV_SCORE = 1 << 30
+HASH_SCORE = 1 << 29
+CAPTURE_SCORE = 1 << 22
+# Captures score a bonus per piece taken, so longer jumps come first.
+KING_CAPTURE_BONUS = 1 << 18
+MAN_CAPTURE_BONUS = 1 << 17
+PROMOTION_SCORE = 1 << 20
+KILLER_SCORE = 1 << 19
+HISTORY_LIMIT = KILLER_SCORE - 1
+
+# How many killer moves are remembered at each ply.
+KILLERS_PER_PLY = 2
+
+
+class MoveOrdering:
+    """This holds the killer and history tables and the ordering counters."""
+
+    def __init__(self):
+        self.killers = {}
+        # Indexed by from_square * 32 + final_square for each side.
+        self.history = {RED: [0] * 1024, BLACK: [0] * 1024}
+        self.reset_counters()
+
+    def reset_counters(self):
+        """This zeroes the cutoff counters, e.g. at the start of a move."""
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        """This forgets the killers and ages the history before a new move."""
+        self.killers = {}
+        for table in self.history.values():
+            for index, value in enumerate(table):
+                if value:
+                    table[index] = value >> 1
+        self.reset_counters()
+
+    def score(self, position, move, ply):
+        """This scores a move for sorting; higher scores are searched first."""
+        start = move[0]
+        end = move[-1]
+        if is_capture(move):
+            score = CAPTURE_SCORE
+            for square in captured_squares(move):
+                score += (KING_CAPTURE_BONUS if position.kings >> square & 1
+                          else MAN_CAPTURE_BONUS)
+            return score
+        if not position.kings >> start & 1 and (1 << end) & (
+                RED_KING_ROW if position.red >> start & 1 else BLACK_KING_ROW):
+            return PROMOTION_SCORE
+        killers = self.killers.get(ply, ())
+        if move in killers:
+            return KILLER_SCORE + KILLERS_PER_PLY - killers.index(move)
+        return min(self.history[position.turn][start * 32 + end],
+                   HISTORY_LIMIT)
+
+    def order(self, position, moves, ply, hash_move=None, pv_move=None):
+        """This sorts moves best-first: PV, hash move, captures, promotions,
+        killers and then by history."""
+        if len(moves) < 2:
+            return moves
+        scores = {move: self.score(position, move, ply) for move in moves}
+        if hash_move in scores:
+            scores[hash_move] = HASH_SCORE
+        if pv_move in scores:
+            scores[pv_move] = PV_SCORE
+        moves.sort(key=scores.__getitem__, reverse=True)
+        return moves
+
+    def record_cutoff(self, position, move, ply, depth, index):
+        """This learns from a move that caused a beta cutoff."""
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        if is_capture(move):
+            return
+        # Quiet moves that refute a position are often good at the same ply.
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[KILLERS_PER_PLY:]
+        self.history[position.turn][move[0] * 32 + move[-1]] += depth * depth
+
+    def report(self):
+        """This summarizes how well the ordering is working."""
+        return {
+            "cutoffs": self.cutoffs,
+            "first_move_cutoffs": self.first_move_cutoffs,
+            "first_move_cutoff_rate": (self.first_move_cutoffs / self.cutoffs
+                                       if self.cutoffs else 0.0),
+        }
@@ -0,0 +1,201 @@
+"""This splits the root moves of a search across several CPU cores.
+
+Each worker process keeps its own Searcher (and transposition table) and
+is sent a packed position plus one root move to search. The eldest
+brother, the first move in the ordering, is searched on its own first so
+the rest start with a useful bound, and the best score found so far is
+shared between the workers so later moves can be pruned against it.
+
+Run it directly for a speedup report against the single-process search:
+
+    python parallel.py --depth 8 --workers 4
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import Value
+
+from engine import RED, Position
+import tablebase
+from search import Searcher
+
+# These are only set inside worker processes, by _init_worker.
+_searcher = None
+_shared_bound = None
+
+
+def _init_worker(shared_bound):
+    """This sets up the per-process searcher and the shared bound."""
+    global _searcher, _shared_bound
+    # Each process maps the same tablebase file, so the OS shares the pages.
+    _searcher = Searcher(tablebase=tablebase.load())
+    _shared_bound = shared_bound
+
+
+def _search_root_move(packed, move, depth, maximizing):
+    """This searches one root move in a worker and returns its score.
+
+    The returned flag says whether the score is exact. A move searched
+    against the shared bound that fails low only has an upper bound.
+    """
+    position = Position.unpack(packed)
+    position.make_move(move)
+    bound = _shared_bound.value
+    if maximizing:
+        alpha, beta = bound, float('inf')
+    else:
+        alpha, beta = float('-inf'), bound
+    _searcher.nodes = 0
+    _searcher.quiescence_nodes = 0
+    _searcher.table.new_search()
+    score, _ = _searcher.minimax(position, depth - 1, not maximizing, alpha,
+                                 beta)
+    exact = score > alpha if maximizing else score < beta
+    if exact:
+        # Publishes the improvement so the other workers can prune with it.
+        with _shared_bound.get_lock():
+            if (score > _shared_bound.value if maximizing else
+                    score < _shared_bound.value):
+                _shared_bound.value = score
+    return move, score, exact, _searcher.nodes + _searcher.quiescence_nodes
+
+
+class ParallelSearcher:
+    """This runs fixed-depth root-split searches on a process pool."""
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.shared_bound = Value('d', 0.0)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            initializer=_init_worker,
+                                            initargs=(self.shared_bound,))
+        # Orders the root moves the same way the serial search would.
+        self.searcher = Searcher()
+        self.nodes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def shutdown(self):
+        """This stops the worker processes."""
+        self.executor.shutdown(cancel_futures=True)
+
+    def search(self, position, depth):
+        """This returns (score, best_move) for the side to move."""
+        maximizing = position.turn == RED
+        moves = self.searcher.ordering.order(position, position.legal_moves(),
+                                             0)
+        if not moves or depth < 2:
+            return self.searcher.minimax(position, depth, maximizing,
+                                         float('-inf'), float('inf'))
+
+        self.shared_bound.value = float('-inf') if maximizing else float('inf')
+        packed = position.pack()
+        self.nodes = 0
+        best_score = None
+        best_move = None
+        best_index = None
+
+        # The first move is searched alone to set the bound for the others.
+        first = self.executor.submit(_search_root_move, packed, moves[0],
+                                     depth, maximizing)
+        pending = {first: 0}
+        queued = list(enumerate(moves[1:], start=1))
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                move, score, exact, nodes = future.result()
+                self.nodes += nodes
+                better = best_score is None or (score > best_score
+                                                if maximizing else
+                                                score < best_score)
+                # Ties go to the earlier move, like the serial search.
+                tie = score == best_score and index < best_index
+                if exact and (better or tie):
+                    best_score, best_move, best_index = score, move, index
+            # Keeps every worker busy once the eldest brother is done.
+            while queued and len(pending) < self.workers:
+                index, move = queued.pop(0)
+                future = self.executor.submit(_search_root_move, packed, move,
+                                              depth, maximizing)
+                pending[future] = index
+        if best_move is None:
+            # Every move loses outright, so none beat the bound. One still
+            # has to be played, so this takes the first, like minimax().
+            return (float('-inf') if maximizing else float('inf')), moves[0]
+        return best_score, best_move
+
+
+def report_positions(count=6, seed=2024):
+    """This plays seeded random openings to get a repeatable position set."""
+    generator = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        position = Position.initial()
+        for _ in range(generator.randint(6, 24)):
+            moves = position.legal_moves()
+            if not moves:
+                break
+            position.make_move(generator.choice(moves))
+        if position.winner() is None:
+            positions.append(position.copy())
+    return positions
+
+
+def speedup_report(depth, workers, positions=None):
+    """This times the parallel search against the serial minimax."""
+    positions = positions or report_positions()
+    rows = []
+    with ParallelSearcher(workers) as parallel:
+        for position in positions:
+            serial = Searcher()
+            start = time.perf_counter()
+            serial_score, serial_move = serial.minimax(
+                position, depth, position.turn == RED, float('-inf'),
+                float('inf'))
+            serial_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            parallel_score, parallel_move = parallel.search(position, depth)
+            parallel_time = time.perf_counter() - start
+
+            rows.append({
+                "position": position.pack(),
+                "serial_time": serial_time,
+                "serial_nodes": serial.nodes + serial.quiescence_nodes,
+                "parallel_time": parallel_time,
+                "parallel_nodes": parallel.nodes,
+                "same_score": serial_score == parallel_score,
+                "same_move": serial_move == parallel_move,
+                "speedup": serial_time / parallel_time if parallel_time else 0.0,
+            })
+    serial_total = sum(row["serial_time"] for row in rows)
+    parallel_total = sum(row["parallel_time"] for row in rows)
+    return {
+        "depth": depth,
+        "workers": workers,
+        "positions": rows,
+        "serial_time": serial_total,
+        "parallel_time": parallel_total,
+        "speedup": serial_total / parallel_total if parallel_total else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    print(json.dumps(speedup_report(args.depth, args.workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
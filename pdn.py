@@ -0,0 +1,164 @@
+"""This writes and reads game records in PDN, the checkers version of PGN.
+
+PDN numbers the squares 1-32 starting from Black's back row, so engine
+square n is PDN square 32 - n. A move is written with its squares joined
+by "-" for a plain move or "x" for a capture, e.g. 9-14 or 9x18x27.
+
+A position is written as a PDN FEN string: the side to move, then each
+side's squares with a K in front of kings, e.g. B:W18,24,K27:B9,12,K20.
+"""
+
+import re
+
+from engine import BLACK, RED, Position, is_capture
+
+# Results as PDN writes them, Black's points first. Red plays the part
+# PDN calls White.
+BLACK_WINS = "2-0"
+RED_WINS = "0-2"
+DRAW = "1-1"
+
+# Other spellings of the results that turn up in PDN files.
+RESULTS = {
+    BLACK_WINS: BLACK_WINS, "1-0": BLACK_WINS,
+    RED_WINS: RED_WINS, "0-1": RED_WINS,
+    DRAW: DRAW, "1/2-1/2": DRAW, "0-0": DRAW,
+}
+
+_TAG = re.compile(r'\[(\w+)\s+"(.*)"\]')
+_COMMENT = re.compile(r"\{[^}]*\}")
+_MOVE = re.compile(r"\d+(?:[-x]\d+)+")
+
+
+def pdn_square(square):
+    """This converts an engine square to PDN numbering, 1-32 from Black's back row."""
+    return 32 - square
+
+
+def pdn_move(move):
+    """This writes a move as PDN, e.g. 9-14 or 9x18x27."""
+    separator = "x" if is_capture(move) else "-"
+    return separator.join(str(pdn_square(square)) for square in move)
+
+
+def parse_move(text, position):
+    """This finds the legal move a PDN move stands for, or None.
+
+    Multi-jumps are sometimes written with only the first and last
+    squares, so those are matched against the legal moves too.
+    """
+    squares = tuple(32 - int(number) for number in re.split("[-x]", text))
+    moves = position.legal_moves()
+    if squares in moves:
+        return squares
+    matches = [move for move in moves
+               if move[0] == squares[0] and move[-1] == squares[-1]]
+    return matches[0] if len(matches) == 1 else None
+
+
+def position_fen(position):
+    """This writes a position as a PDN FEN string, e.g. B:W18,24,K27:B9,12."""
+    fields = ["W" if position.turn == RED else "B"]
+    for letter, bits in (("W", position.red), ("B", position.black)):
+        squares = sorted((pdn_square(square), position.kings >> square & 1)
+                         for square in range(32) if bits >> square & 1)
+        fields.append(letter + ",".join(
+            ("K" if king else "") + str(number) for number, king in squares))
+    return ":".join(fields)
+
+
+def parse_fen(text):
+    """This reads a PDN FEN string into a Position.
+
+    Squares may also be given as ranges, e.g. B1-12. It raises ValueError
+    if the text isn't a valid position.
+    """
+    fields = text.strip().rstrip(".").split(":")
+    if len(fields) != 3 or fields[0] not in ("W", "B"):
+        raise ValueError(f"Not a FEN position: {text!r}")
+    bits = {"W": 0, "B": 0}
+    kings = 0
+    for field in fields[1:]:
+        letter = field[:1]
+        if letter not in bits:
+            raise ValueError(f"Not a FEN position: {text!r}")
+        for token in filter(None, field[1:].split(",")):
+            king = token.startswith("K")
+            first, _, last = token.lstrip("K").partition("-")
+            if not first.isdigit() or last and not last.isdigit():
+                raise ValueError(f"Bad square {token!r} in {text!r}")
+            for number in range(int(first), int(last or first) + 1):
+                if not 1 <= number <= 32:
+                    raise ValueError(f"Bad square {number} in {text!r}")
+                bit = 1 << pdn_square(number)
+                if (bits["W"] | bits["B"]) & bit:
+                    raise ValueError(f"Square {number} is used twice in "
+                                     f"{text!r}")
+                bits[letter] |= bit
+                if king:
+                    kings |= bit
+    return Position(bits["W"], bits["B"], kings,
+                    RED if fields[0] == "W" else BLACK)
+
+
+def pdn_record(game, event="Engine tournament"):
+    """This writes one game as PDN text."""
+    lines = [
+        f'[Event "{event}"]',
+        f'[Round "{game["round"]}"]',
+        f'[Black "{game["black"]}"]',
+        f'[White "{game["red"]}"]',
+        f'[Result "{game["result"]}"]',
+        f'[Termination "{game["termination"]}"]',
+    ]
+    tokens = []
+    for ply, move in enumerate(game["moves"]):
+        if ply % 2 == 0:
+            tokens.append(f"{ply // 2 + 1}.")
+        tokens.append(pdn_move(move))
+    tokens.append(game["result"])
+
+    # PDN lines are wrapped at 80 characters like PGN.
+    text = []
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            text.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    text.append(line)
+    return "\n".join(lines) + "\n\n" + "\n".join(text) + "\n"
+
+
+def read_games(lines):
+    """This yields (tags, moves, result) for each game in PDN text.
+
+    It reads line by line, so a large file is never held in memory.
+    Games are replayed from the start position as they are read; a game
+    with a move that isn't legal is cut short at that move.
+    """
+    tags = {}
+    moves = []
+    position = Position.initial()
+    broken = False
+    for line in lines:
+        line = line.strip()
+        match = _TAG.match(line)
+        if match:
+            tags[match.group(1)] = match.group(2)
+            continue
+        for token in _COMMENT.sub(" ", line).split():
+            if token in RESULTS:
+                yield tags, moves, RESULTS[token]
+                tags = {}
+                moves = []
+                position = Position.initial()
+                broken = False
+            elif not broken and _MOVE.fullmatch(token):
+                move = parse_move(token, position)
+                if move is None:
+                    broken = True
+                    continue
+                position.make_move(move)
+                moves.append(move)
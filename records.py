@@ -0,0 +1,329 @@
+"""This stores finished games compactly, replays them and indexes them.
+
+A record file is a header followed by one record per game, appended as
+games finish and never rewritten. Each record is a small header (the
+result, the number of plies and the size of the moves) and then the
+moves, one byte per square with the top bit set on a move's last square:
+a plain move takes two bytes and a double jump three.
+
+An index file maps the Zobrist hash of every position in the games to
+(game, ply), sorted by hash, so finding every game that reached a
+position is a binary search over a memory-mapped file rather than a
+replay of the whole archive. Games added after the index was built are
+replayed and searched directly, so an index doesn't have to be rebuilt
+after every game.
+
+    python records.py index games.rec
+    python records.py find games.rec "W:W18,21-31:B1-11,14"
+    python records.py show games.rec 12 --ply 30
+"""
+
+import argparse
+import heapq
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+from engine import Position
+from pdn import BLACK_WINS, DRAW, RED_WINS, parse_fen, pdn_move, position_fen
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CKGR"
+INDEX_MAGIC = b"CKGI"
+# Bumped whenever the record or index layout changes.
+RECORDS_VERSION = 1
+HEADER = struct.Struct("<4sH")  # magic, version
+GAME = struct.Struct("<BHH")  # result, plies, size of the moves in bytes
+INDEX_HEADER = struct.Struct("<4sHII")  # magic, version, games, entries
+ENTRY = struct.Struct("<QIH")  # position hash, game, ply
+
+# Results are stored as their position in this tuple.
+RESULTS = (DRAW, BLACK_WINS, RED_WINS)
+
+# This marks the last square of a move.
+LAST_SQUARE = 0x80
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "games.rec")
+
+
+def index_path(path):
+    """This returns where the index of a record file is kept."""
+    return path + ".idx"
+
+
+def encode_moves(moves):
+    """This packs a list of moves into bytes."""
+    data = bytearray()
+    for move in moves:
+        data.extend(move[:-1])
+        data.append(move[-1] | LAST_SQUARE)
+    return bytes(data)
+
+
+def decode_moves(data):
+    """This unpacks the bytes made by encode_moves into a list of moves."""
+    moves = []
+    squares = []
+    for value in data:
+        if value & LAST_SQUARE:
+            squares.append(value & ~LAST_SQUARE)
+            moves.append(tuple(squares))
+            squares = []
+        else:
+            squares.append(value)
+    return moves
+
+
+class GameWriter:
+    """This appends finished games to a record file."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.handle = open(path, "ab+")
+        self.handle.seek(0)
+        header = self.handle.read(HEADER.size)
+        if not header:
+            self.handle.write(HEADER.pack(MAGIC, RECORDS_VERSION))
+        elif header != HEADER.pack(MAGIC, RECORDS_VERSION):
+            self.handle.close()
+            raise ValueError(f"{path} is not a version {RECORDS_VERSION} "
+                             "game record file.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """This closes the file."""
+        self.handle.close()
+
+    def append(self, moves, result):
+        """This writes one game, given its moves and PDN result, to the end."""
+        data = encode_moves(moves)
+        self.handle.write(
+            GAME.pack(RESULTS.index(result), len(moves), len(data)) + data)
+        # Each game is on disk as soon as it is written, so a crash can
+        # only lose the game in progress.
+        self.handle.flush()
+
+
+class GameArchive:
+    """This is a read-only, memory-mapped record file."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.handle = open(path, "rb")
+        self.data = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:HEADER.size] != HEADER.pack(MAGIC, RECORDS_VERSION):
+            self.close()
+            raise ValueError(f"{path} is not a version {RECORDS_VERSION} "
+                             "game record file.")
+        # Where each game's record starts. A record cut short by a crash
+        # at the end of the file is left out.
+        self.offsets = array("Q")
+        offset = HEADER.size
+        while offset + GAME.size <= len(self.data):
+            _, _, size = GAME.unpack_from(self.data, offset)
+            if offset + GAME.size + size > len(self.data):
+                break
+            self.offsets.append(offset)
+            offset += GAME.size + size
+
+    def close(self):
+        """This unmaps the file."""
+        self.data.close()
+        self.handle.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def result(self, game):
+        """This returns a game's PDN result."""
+        return RESULTS[self.data[self.offsets[game]]]
+
+    def moves(self, game):
+        """This returns a game's moves."""
+        offset = self.offsets[game]
+        _, _, size = GAME.unpack_from(self.data, offset)
+        start = offset + GAME.size
+        return decode_moves(self.data[start:start + size])
+
+    def replay(self, game, ply=None):
+        """This returns the position after the first ply moves of a game.
+
+        Without a ply it is the final position.
+        """
+        position = Position.initial()
+        for move in self.moves(game)[:ply]:
+            position.make_move(move)
+        return position
+
+    def positions(self, game):
+        """This yields (ply, position) for every position in a game.
+
+        The same Position object is updated in place from ply to ply.
+        """
+        position = Position.initial()
+        yield 0, position
+        for ply, move in enumerate(self.moves(game), start=1):
+            position.make_move(move)
+            yield ply, position
+
+    def find(self, key, index=None):
+        """This lists (game, ply) for every time a position hash was reached.
+
+        The index, if given, answers for the games it covers and the
+        rest are replayed.
+        """
+        found = index.lookup(key) if index is not None else []
+        start = min(index.games, len(self)) if index is not None else 0
+        for game in range(start, len(self)):
+            found.extend((game, ply) for ply, position in self.positions(game)
+                         if position.hash == key)
+        return found
+
+
+class GameIndex:
+    """This is a read-only, memory-mapped index of position hashes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = open(path, "rb")
+        self.data = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.games, self.count = INDEX_HEADER.unpack_from(
+            self.data, 0)
+        if magic != INDEX_MAGIC or version != RECORDS_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {RECORDS_VERSION} "
+                             "game index; please rebuild it.")
+
+    def close(self):
+        """This unmaps the file."""
+        self.data.close()
+        self.handle.close()
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, key):
+        """This lists (game, ply) for every indexed time a hash was reached."""
+        # This finds the first entry with the key, like bisect_left.
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, _, _ = ENTRY.unpack_from(
+                self.data, INDEX_HEADER.size + middle * ENTRY.size)
+            if entry_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        for number in range(low, self.count):
+            entry_key, game, ply = ENTRY.unpack_from(
+                self.data, INDEX_HEADER.size + number * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((game, ply))
+        return found
+
+
+def _write_run(entries, directory):
+    """This writes one sorted run of index entries to a temporary file."""
+    handle = tempfile.TemporaryFile(dir=directory)
+    for entry in sorted(entries):
+        handle.write(ENTRY.pack(*entry))
+    handle.seek(0)
+    return handle
+
+
+def _read_run(handle):
+    """This streams the entries back out of a run file."""
+    while data := handle.read(ENTRY.size * 4096):
+        yield from ENTRY.iter_unpack(data)
+
+
+def build_index(archive, path, run_size=1 << 20):
+    """This indexes every position of every game in an archive.
+
+    The entries are sorted in runs of run_size, which are merged into the
+    index file, so memory use doesn't grow with the archive.
+    """
+    runs = []
+    count = 0
+    directory = os.path.dirname(os.path.abspath(path))
+    entries = []
+    try:
+        for game in range(len(archive)):
+            for ply, position in archive.positions(game):
+                entries.append((position.hash, game, ply))
+            if len(entries) >= run_size:
+                runs.append(_write_run(entries, directory))
+                count += len(entries)
+                entries = []
+        runs.append(_write_run(entries, directory))
+        count += len(entries)
+        entries = []
+
+        with open(path, "wb") as handle:
+            handle.write(INDEX_HEADER.pack(INDEX_MAGIC, RECORDS_VERSION,
+                                           len(archive), count))
+            for entry in heapq.merge(*(_read_run(run) for run in runs)):
+                handle.write(ENTRY.pack(*entry))
+    finally:
+        for run in runs:
+            run.close()
+    return path
+
+
+def load_index(path):
+    """This opens an index if the file exists, or returns None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return GameIndex(path)
+    except ValueError as error:
+        logger.warning("%s", error)
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    index_command = commands.add_parser("index",
+                                        help="build the position index")
+    index_command.add_argument("records")
+    find_command = commands.add_parser(
+        "find", help="list every game that reached a position")
+    find_command.add_argument("records")
+    find_command.add_argument("fen", help="the position as a PDN FEN string")
+    show_command = commands.add_parser("show", help="replay one game")
+    show_command.add_argument("records")
+    show_command.add_argument("game", type=int, help="the game, from 0")
+    show_command.add_argument("--ply", type=int, default=None)
+    args = parser.parse_args()
+
+    archive = GameArchive(args.records)
+    if args.command == "index":
+        path = build_index(archive, index_path(args.records))
+        print(f"Indexed {len(archive)} games in {path}")
+    elif args.command == "find":
+        index = load_index(index_path(args.records))
+        for game, ply in archive.find(parse_fen(args.fen).hash, index):
+            print(f"game {game} ply {ply} ({archive.result(game)})")
+    else:
+        moves = archive.moves(args.game)
+        ply = len(moves) if args.ply is None else args.ply
+        print(" ".join(pdn_move(move) for move in moves[:ply]))
+        print(position_fen(archive.replay(args.game, ply)))
+        print(archive.result(args.game))
+
+
+if __name__ == "__main__":
+    main()
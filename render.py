@@ -0,0 +1,132 @@
+"""This draws the board on the canvas, changing only what has changed.
+
+The view remembers what it last drew: the pieces as the same three
+bitboards the engine uses, and the set of highlighted squares. Bringing
+it up to date with a position XORs the bitboards to find the dirty
+squares, and only the canvas items on those squares are touched. A
+piece that moved keeps its canvas item, so a move is one coords() call
+and a capture one delete(), however full the board is.
+"""
+
+from engine import BLACK, RED, square_to_coords
+
+SQUARE_SIZE = 100
+CHECKER_MARGIN = 25
+
+
+class BoardView:
+    """This owns the square and checker items on a canvas."""
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        # Canvas items, the squares by (row, col) and the checkers by the
+        # engine square they stand on.
+        self.squares = {}
+        self.checkers = {}
+        # What is on the canvas now, in the engine's bitboard form.
+        self.red = 0
+        self.black = 0
+        self.kings = 0
+        self.highlighted = set()
+        self.draw_board()
+
+    def draw_board(self):
+        """This draws the 64 squares. It is only needed once per window."""
+        for row in range(8):
+            for col in range(8):
+                x1, y1 = col * SQUARE_SIZE, row * SQUARE_SIZE
+                x2, y2 = x1 + SQUARE_SIZE, y1 + SQUARE_SIZE
+                # Alternates color on every other square.
+                color = "black" if (row + col) % 2 else "white"
+                self.squares[(row, col)] = self.canvas.create_rectangle(
+                    x1, y1, x2, y2, fill=color, tags="square")
+
+    def place(self, square):
+        """This puts a checker back in the middle of its square."""
+        row, col = square_to_coords(square)
+        x1 = col * SQUARE_SIZE + CHECKER_MARGIN
+        y1 = row * SQUARE_SIZE + CHECKER_MARGIN
+        size = SQUARE_SIZE - 2 * CHECKER_MARGIN
+        self.canvas.coords(self.checkers[square], x1, y1, x1 + size, y1 + size)
+
+    def crown(self, square, is_king):
+        """This draws a checker as a king (gold rim) or as a man."""
+        if is_king:
+            self.canvas.itemconfig(self.checkers[square], outline="gold",
+                                   width=2)
+        else:
+            self.canvas.itemconfig(self.checkers[square], outline="black",
+                                   width=1)
+
+    def sync(self, position):
+        """This updates the checkers to match a position.
+
+        It returns the dirty squares. Squares a piece left are paired with
+        squares a piece of the same color arrived on, so a moved piece
+        keeps its item; anything left over is created or deleted.
+        """
+        changed = ((self.red ^ position.red) | (self.black ^ position.black) |
+                   (self.kings ^ position.kings))
+        dirty = [square for square in range(32) if changed >> square & 1]
+        # The items of pieces that left, with whether they were kings.
+        left = {RED: [], BLACK: []}
+        arrived = []
+        for square in dirty:
+            was = self.color_at(square)
+            now = (RED if position.red >> square & 1 else
+                   BLACK if position.black >> square & 1 else None)
+            if was != now:
+                if was is not None:
+                    left[was].append((self.checkers.pop(square),
+                                      self.kings >> square & 1))
+                if now is not None:
+                    arrived.append((square, now))
+            else:
+                # Only the crown changed, e.g. a crowning taken back.
+                self.crown(square, position.kings >> square & 1)
+
+        for square, color in arrived:
+            is_king = position.kings >> square & 1
+            if left[color]:
+                self.checkers[square], was_king = left[color].pop()
+            else:
+                self.checkers[square] = self.canvas.create_oval(
+                    0, 0, 0, 0, fill=color, tags="checker")
+                was_king = 0
+            self.place(square)
+            if is_king != was_king:
+                self.crown(square, is_king)
+        for items in left.values():
+            for checker_id, _ in items:
+                self.canvas.delete(checker_id)
+
+        self.red, self.black, self.kings = (position.red, position.black,
+                                            position.kings)
+        return dirty
+
+    def color_at(self, square):
+        """This returns the color of the checker drawn on a square, or None."""
+        if self.red >> square & 1:
+            return RED
+        if self.black >> square & 1:
+            return BLACK
+        return None
+
+    def highlight(self, cells):
+        """This outlines the given (row, col) squares in gold.
+
+        Only squares that change state are reconfigured.
+        """
+        cells = set(cells)
+        for cell in cells ^ self.highlighted:
+            if cell in cells:
+                self.canvas.itemconfig(self.squares[cell], outline="gold",
+                                       width=2)
+            else:
+                self.canvas.itemconfig(self.squares[cell], outline="black",
+                                       width=1)
+        self.highlighted = cells
+
+    def clear_highlights(self):
+        """This removes every highlight."""
+        self.highlight(())
@@ -0,0 +1,592 @@
+"""This is the minimax search, which runs on engine positions without Tk."""
+
+import gc
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from engine import BLACK, KING_VALUE, RED
+from ordering import MoveOrdering
+from tablebase import DRAW, LOSS
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+# The deepest iteration the time-limited search will start.
+MAX_DEPTH = 64
+
+# How many nodes are searched between looks at the clock.
+CLOCK_CHECK_INTERVAL = 1024
+
+# Aspiration windows start this far either side of the previous
+# iteration's score, and widen by ASPIRATION_GROWTH each time they fail.
+ASPIRATION_WINDOW = 50
+ASPIRATION_GROWTH = 4
+
+# Tablebase wins score this, less the plies to the win, so that they
+# outrank any evaluation and quicker wins are preferred.
+TABLEBASE_WIN = 10000
+
+# Trace levels: how much detail the search sends to a trace sink.
+TRACE_MOVES = 1  # One "search" event per move, with the summary.
+TRACE_ITERATIONS = 2  # Plus one "iteration" event per completed depth.
+TRACE_NODES = 3  # Plus one "node" event per node, which is slow.
+
+# This is what a completed search iteration reports.
+SearchResult = namedtuple("SearchResult",
+                          ["move", "score", "depth", "pv", "nodes", "elapsed"])
+
+
+class SearchTimeout(Exception):
+    """This is raised inside the search when time runs out or it is stopped."""
+
+
+class Searcher:
+    """This is the minimax algorithm with alpha-beta pruning. Red maximizes.
+
+    Timed searches use pvs(), a negamax form of the same search that
+    tries null windows on all but the first move, inside aspiration
+    windows. minimax() is kept as the plain alpha-beta search.
+    """
+
+    def __init__(self,
+                 transposition_table=None,
+                 trace=None,
+                 trace_level=TRACE_ITERATIONS,
+                 tablebase=None,
+                 quiescence=True,
+                 evaluator=None,
+                 batch_frontier=False,
+                 gc_threshold=None):
+        self.table = (transposition_table if transposition_table is not None
+                      else TranspositionTable())
+        # An endgame tablebase to look positions up in, if one is loaded.
+        self.tablebase = tablebase
+        # Whether captures are searched past the nominal depth.
+        self.quiescence = quiescence
+        # A weighted Evaluator to score leaves with instead of the
+        # position's own score.
+        self.evaluator = evaluator
+        # Whether the leaves below each depth-1 node are scored as one NumPy
+        # batch. Batches that small rarely beat scoring leaves one by one,
+        # since every child is scored before any can be cut off.
+        self.batch_frontier = batch_frontier
+        # The garbage collector's generation-0 threshold while a search
+        # runs. None leaves it alone and 0 turns automatic collection off;
+        # the search makes no reference cycles, and whatever else piles up
+        # is collected once the old threshold is back.
+        self.gc_threshold = gc_threshold
+        self.ordering = MoveOrdering()
+        # The trace sink is called as trace(event, fields). With no sink,
+        # the only per-node cost is the trace_nodes check.
+        self.trace = trace
+        self.trace_level = trace_level if trace is not None else 0
+        self.trace_nodes = self.trace_level >= TRACE_NODES
+        self.reset_stats()
+        self.deadline = None
+        # The current search's time budget, which ponder_hit() can change.
+        self.time_limit = None
+        # Set from another thread to stop a time-limited search early.
+        self.stop_event = None
+        # Maps position hashes on the previous principal variation to their moves.
+        self.pv = {}
+
+    def reset_stats(self):
+        """This zeroes the counters before a new move is searched."""
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.evaluations = 0
+        self.tablebase_hits = 0
+        # Null-window searches that failed high and had to be redone.
+        self.researches = 0
+        # Aspiration windows that the score fell outside of.
+        self.aspiration_failures = 0
+        self.iterations = []
+        self.started = time.perf_counter()
+        self.table_hits = self.table.hits
+        self.table_misses = self.table.misses
+
+    def summary(self):
+        """This returns the counters for the most recent move as a dict."""
+        elapsed = time.perf_counter() - self.started
+        total_nodes = self.nodes + self.quiescence_nodes
+        hits = self.table.hits - self.table_hits
+        misses = self.table.misses - self.table_misses
+        ordering = self.ordering.report()
+        return {
+            "nodes": self.nodes,
+            "quiescence_nodes": self.quiescence_nodes,
+            "evaluations": self.evaluations,
+            "cutoffs": ordering["cutoffs"],
+            "first_move_cutoff_rate": ordering["first_move_cutoff_rate"],
+            "tt_hits": hits,
+            "tt_misses": misses,
+            "tt_hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "tablebase_hits": self.tablebase_hits,
+            "researches": self.researches,
+            "aspiration_failures": self.aspiration_failures,
+            "elapsed": elapsed,
+            "nodes_per_second": total_nodes / elapsed if elapsed else 0.0,
+            "iterations": list(self.iterations),
+        }
+
+    def evaluation_function(self, position):
+        """Evaluates the board by material and where the pieces stand.
+
+        The position keeps this score up to date as moves are made and
+        taken back, so reading it is constant time. An evaluator, if one
+        was given, scores the features itself.
+        """
+        if self.evaluator is not None:
+            return self.evaluator.score(position)
+        return position.score
+
+    def evaluate_frontier(self, position, moves):
+        """This scores the quiet children of a depth-1 node in one batch.
+
+        It returns {move: score}. Children that would be searched further,
+        because they have captures for quiescence or are in the
+        tablebase, are left out and searched as usual.
+        """
+        boards = []
+        quiet = []
+        for move in moves:
+            position.make_move(move)
+            if (position.red and position.black and
+                    not (self.quiescence and position.has_captures()) and
+                    (self.tablebase is None or
+                     (position.red | position.black).bit_count() >
+                     self.tablebase.max_pieces)):
+                boards.append(position.pack())
+                quiet.append(move)
+            position.unmake_move()
+        if self.quiescence:
+            self.quiescence_nodes += len(quiet)
+        else:
+            self.nodes += len(quiet)
+        self.evaluations += len(quiet)
+        return dict(zip(quiet, self.evaluator.evaluate(boards)))
+
+    def tablebase_score(self, position, result, distance):
+        """This turns a tablebase result for the side to move into a score."""
+        if result == DRAW:
+            return 0
+        score = TABLEBASE_WIN - distance
+        if result == LOSS:
+            score = -score
+        return score if position.turn == RED else -score
+
+    def probe_tablebase(self, position):
+        """This returns the tablebase score of a small endgame, or None."""
+        if (self.tablebase is None or (position.red | position.black).bit_count()
+                > self.tablebase.max_pieces):
+            return None
+        found = self.tablebase.probe(position)
+        if found is None:
+            return None
+        self.tablebase_hits += 1
+        return self.tablebase_score(position, *found)
+
+    @contextmanager
+    def collection_settings(self):
+        """This applies gc_threshold for the length of a search."""
+        if self.gc_threshold is None:
+            yield
+            return
+        previous = gc.get_threshold()
+        gc.set_threshold(self.gc_threshold, *previous[1:])
+        try:
+            yield
+        finally:
+            gc.set_threshold(*previous)
+
+    def check_clock(self, count):
+        """This raises SearchTimeout every so often once time is up."""
+        if (self.deadline is not None and
+                not count % CLOCK_CHECK_INTERVAL and
+                (time.perf_counter() > self.deadline or
+                 self.stop_event is not None and self.stop_event.is_set())):
+            raise SearchTimeout()
+
+    def quiescence_search(self, position, maximizing_player, alpha, beta,
+                          ply):
+        """This searches only captures until the position is quiet.
+
+        Captures are forced, so a side that can capture has to, and the
+        position is only evaluated once the side to move has none. Each
+        capture is a whole jump sequence, so multi-jumps are searched to
+        the end.
+        """
+        self.quiescence_nodes += 1
+        self.check_clock(self.quiescence_nodes)
+        if self.trace_nodes:
+            self.trace("node", {"ply": ply, "depth": 0, "alpha": alpha,
+                                "beta": beta, "hash": position.hash,
+                                "quiescence": True})
+        if not position.red or not position.black:
+            self.evaluations += 1
+            return self.evaluation_function(position)
+        if ply:
+            score = self.probe_tablebase(position)
+            if score is not None:
+                return score
+
+        moves = position.captures(RED if maximizing_player else BLACK)
+        if not moves:
+            self.evaluations += 1
+            return self.evaluation_function(position)
+
+        best_eval = float('-inf') if maximizing_player else float('inf')
+        for move in self.ordering.order(position, moves, ply):
+            position.make_move(move)
+            eval = self.quiescence_search(position, not maximizing_player,
+                                          alpha, beta, ply + 1)
+            position.unmake_move()
+            if maximizing_player:
+                best_eval = max(best_eval, eval)
+                alpha = max(alpha, eval)
+            else:
+                best_eval = min(best_eval, eval)
+                beta = min(beta, eval)
+            if beta <= alpha:
+                break
+        return best_eval
+
+    def minimax(self, position, depth, maximizing_player, alpha, beta, ply=0):
+        """This searches the position and returns (score, best_move)."""
+        # Past the horizon only captures are searched, and counted apart.
+        if depth == 0 and self.quiescence:
+            return self.quiescence_search(position, maximizing_player, alpha,
+                                          beta, ply), None
+        self.nodes += 1
+        self.check_clock(self.nodes)
+        if self.trace_nodes:
+            self.trace("node", {"ply": ply, "depth": depth, "alpha": alpha,
+                                "beta": beta, "hash": position.hash})
+        if not position.red or not position.black:
+            self.evaluations += 1
+            return self.evaluation_function(position), None
+
+        # Small endgames are looked up instead of searched. The root is
+        # still searched, because the caller needs a move.
+        if ply:
+            score = self.probe_tablebase(position)
+            if score is not None:
+                return score, None
+
+        if depth == 0:
+            self.evaluations += 1
+            return self.evaluation_function(position), None
+
+        # A result from another move order may settle this position already.
+        alpha_original, beta_original = alpha, beta
+        hash_move = None
+        entry = self.table.probe(position.hash)
+        if entry is not None:
+            entry_depth, entry_score, bound, hash_move = entry
+            if entry_depth >= depth:
+                if bound == EXACT:
+                    return entry_score, hash_move
+                if bound == LOWER:
+                    alpha = max(alpha, entry_score)
+                elif bound == UPPER:
+                    beta = min(beta, entry_score)
+                if beta <= alpha:
+                    return entry_score, hash_move
+
+        # The previous iteration's PV move goes first, then the hash move.
+        moves = self.ordering.order(
+            position, position.legal_moves(RED if maximizing_player else BLACK),
+            ply, hash_move, self.pv.get(position.hash))
+        leaf_scores = (self.evaluate_frontier(position, moves)
+                       if depth == 1 and self.batch_frontier and
+                       self.evaluator is not None and self.evaluator.batched
+                       else {})
+
+        # Even when every move loses, one of them still has to be played.
+        best_move = moves[0] if moves else None
+        if maximizing_player:
+            best_eval = float('-inf')
+            for index, move in enumerate(moves):
+                if move in leaf_scores:
+                    eval = leaf_scores[move]
+                else:
+                    position.make_move(move)
+                    eval, _ = self.minimax(position, depth - 1, False, alpha,
+                                           beta, ply + 1)
+                    position.unmake_move()
+                if eval > best_eval:
+                    best_eval = eval
+                    best_move = move
+                alpha = max(alpha, eval)
+                if beta <= alpha:
+                    self.ordering.record_cutoff(position, move, ply, depth,
+                                                index)
+                    break
+        else:
+            best_eval = float('inf')
+            for index, move in enumerate(moves):
+                if move in leaf_scores:
+                    eval = leaf_scores[move]
+                else:
+                    position.make_move(move)
+                    eval, _ = self.minimax(position, depth - 1, True, alpha,
+                                           beta, ply + 1)
+                    position.unmake_move()
+                if eval < best_eval:
+                    best_eval = eval
+                    best_move = move
+                beta = min(beta, eval)
+                if beta <= alpha:
+                    self.ordering.record_cutoff(position, move, ply, depth,
+                                                index)
+                    break
+
+        if best_eval <= alpha_original:
+            bound = UPPER
+        elif best_eval >= beta_original:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.store(position.hash, depth, best_eval, bound, best_move)
+        return best_eval, best_move
+
+    def pvs(self, position, depth, alpha, beta, ply=0):
+        """This is principal variation search in negamax form.
+
+        Scores are from the side to move's point of view, so each child's
+        score is negated. The first move is searched with the full window
+        and the rest with a null window, which only proves they are no
+        better; one that turns out better is searched again properly. The
+        transposition table is shared with minimax(), so entries are
+        stored from Red's point of view.
+        """
+        sign = 1 if position.turn == RED else -1
+        if depth == 0 and self.quiescence:
+            # Quiescence works from Red's point of view, like minimax().
+            if sign > 0:
+                return self.quiescence_search(position, True, alpha, beta,
+                                              ply), None
+            return -self.quiescence_search(position, False, -beta, -alpha,
+                                           ply), None
+        self.nodes += 1
+        self.check_clock(self.nodes)
+        if self.trace_nodes:
+            self.trace("node", {"ply": ply, "depth": depth, "alpha": alpha,
+                                "beta": beta, "hash": position.hash})
+        if not position.red or not position.black:
+            self.evaluations += 1
+            return sign * self.evaluation_function(position), None
+        if ply:
+            score = self.probe_tablebase(position)
+            if score is not None:
+                return sign * score, None
+        if depth == 0:
+            self.evaluations += 1
+            return sign * self.evaluation_function(position), None
+
+        alpha_original = alpha
+        hash_move = None
+        entry = self.table.probe(position.hash)
+        if entry is not None:
+            entry_depth, entry_score, bound, hash_move = entry
+            if entry_depth >= depth:
+                entry_score *= sign
+                # A bound on Red's score is the opposite bound for Black.
+                if sign < 0 and bound != EXACT:
+                    bound = UPPER if bound == LOWER else LOWER
+                if bound == EXACT:
+                    return entry_score, hash_move
+                if bound == LOWER:
+                    alpha = max(alpha, entry_score)
+                elif bound == UPPER:
+                    beta = min(beta, entry_score)
+                if beta <= alpha:
+                    return entry_score, hash_move
+
+        moves = self.ordering.order(position, position.legal_moves(), ply,
+                                    hash_move, self.pv.get(position.hash))
+        leaf_scores = (self.evaluate_frontier(position, moves)
+                       if depth == 1 and self.batch_frontier and
+                       self.evaluator is not None and self.evaluator.batched
+                       else {})
+
+        # Even when every move loses, one of them still has to be played.
+        best_move = moves[0] if moves else None
+        best_score = float('-inf')
+        for index, move in enumerate(moves):
+            if move in leaf_scores:
+                score = sign * leaf_scores[move]
+            else:
+                position.make_move(move)
+                if index == 0 or alpha == float('-inf'):
+                    score = -self.pvs(position, depth - 1, -beta, -alpha,
+                                      ply + 1)[0]
+                else:
+                    score = -self.pvs(position, depth - 1, -alpha - 1, -alpha,
+                                      ply + 1)[0]
+                    if alpha < score < beta:
+                        self.researches += 1
+                        score = -self.pvs(position, depth - 1, -beta, -score,
+                                          ply + 1)[0]
+                position.unmake_move()
+            if score > best_score:
+                best_score = score
+                best_move = move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                self.ordering.record_cutoff(position, move, ply, depth, index)
+                break
+
+        if best_score <= alpha_original:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        if sign < 0 and bound != EXACT:
+            bound = UPPER if bound == LOWER else LOWER
+        self.table.store(position.hash, depth, sign * best_score, bound,
+                         best_move)
+        return best_score, best_move
+
+    def aspiration_search(self, position, depth, previous=None):
+        """This runs pvs() in a narrow window around the previous score.
+
+        Most iterations score close to the one before, and the narrow
+        window prunes more. If the score falls outside, the window is
+        widened and the depth searched again. Scores are from Red's
+        point of view, as minimax() gives them.
+        """
+        sign = 1 if position.turn == RED else -1
+        if previous is None or abs(previous) >= TABLEBASE_WIN:
+            score, move = self.pvs(position, depth, float('-inf'),
+                                   float('inf'))
+            return sign * score, move
+        guess = sign * previous
+        window = ASPIRATION_WINDOW
+        while True:
+            alpha = guess - window if window else float('-inf')
+            beta = guess + window if window else float('inf')
+            score, move = self.pvs(position, depth, alpha, beta)
+            if alpha < score < beta or not window:
+                return sign * score, move
+            self.aspiration_failures += 1
+            window *= ASPIRATION_GROWTH
+            # Past a few kings' worth, the full window is quicker.
+            if window > 4 * KING_VALUE:
+                window = 0
+
+    def best_move(self, position, depth):
+        """This returns the best move for the side to move at a fixed depth."""
+        self.table.new_search()
+        self.ordering.new_search()
+        self.reset_stats()
+        with self.collection_settings():
+            score, move = self.aspiration_search(position, depth)
+        self.iterations.append({"depth": depth, "score": score,
+                                "nodes": self.nodes,
+                                "elapsed": time.perf_counter() - self.started})
+        if self.trace_level >= TRACE_MOVES:
+            self.trace("search", self.summary())
+        return move
+
+    def ponder_hit(self, time_limit):
+        """This gives a running search time_limit more seconds from now.
+
+        It is called from another thread when a search started with no
+        time limit, while pondering, becomes the real search for a move.
+        """
+        self.time_limit = time.perf_counter() - self.started + time_limit
+        if self.deadline is not None:
+            self.deadline = self.started + self.time_limit
+
+    def principal_variation(self, position, depth):
+        """This follows the best moves stored in the table from the position."""
+        pv = []
+        for _ in range(depth):
+            entry = self.table.peek(position.hash)
+            if entry is None or entry[3] not in position.legal_moves():
+                break
+            pv.append(entry[3])
+            position.make_move(entry[3])
+        for _ in pv:
+            position.unmake_move()
+        return pv
+
+    def iterative_deepening(self,
+                            position,
+                            time_limit,
+                            max_depth=MAX_DEPTH,
+                            stop_event=None,
+                            on_iteration=None):
+        """This searches one ply deeper at a time until the time budget is spent.
+
+        The move from the deepest completed iteration is returned as a
+        SearchResult. The first iteration always runs to completion so there
+        is a move to play, however small the budget. Setting stop_event ends
+        the search early in the same way, and on_iteration is called with
+        each completed iteration's SearchResult.
+        """
+        self.stop_event = stop_event
+        self.time_limit = time_limit
+        self.table.new_search()
+        self.ordering.new_search()
+        self.reset_stats()
+        self.pv = {}
+        start = self.started
+        stack_depth = len(position.move_stack)
+        result = None
+
+        with self.collection_settings():
+            for depth in range(1, max_depth + 1):
+                try:
+                    score, move = self.aspiration_search(
+                        position, depth, result.score if result else None)
+                except SearchTimeout:
+                    # Unwinds the moves the interrupted iteration left on
+                    # the board.
+                    while len(position.move_stack) > stack_depth:
+                        position.unmake_move()
+                    break
+                # Once there is a move to fall back on, the clock may
+                # interrupt.
+                self.deadline = start + self.time_limit
+
+                pv = self.principal_variation(position, depth)
+                elapsed = time.perf_counter() - start
+                result = SearchResult(move, score, depth, pv, self.nodes,
+                                      elapsed)
+                self.iterations.append({"depth": depth, "score": score,
+                                        "nodes": self.nodes,
+                                        "elapsed": elapsed})
+                if self.trace_level >= TRACE_ITERATIONS:
+                    self.trace("iteration", {"depth": depth, "score": score,
+                                             "move": move, "pv": pv,
+                                             "nodes": self.nodes,
+                                             "elapsed": elapsed})
+                if on_iteration is not None:
+                    on_iteration(result)
+
+                # The next iteration orders these moves first.
+                self.pv = {}
+                for pv_move in pv:
+                    self.pv[position.hash] = pv_move
+                    position.make_move(pv_move)
+                for _ in pv:
+                    position.unmake_move()
+
+                # A decided game or no moves at all won't change with more
+                # depth.
+                if move is None or abs(score) == float('inf'):
+                    break
+                # The next iteration costs several times this one, so it is
+                # only started if it has a fair chance of finishing.
+                if elapsed > self.time_limit / 2:
+                    break
+                if stop_event is not None and stop_event.is_set():
+                    break
+
+        self.deadline = None
+        self.stop_event = None
+        if self.trace_level >= TRACE_MOVES:
+            self.trace("search", self.summary())
+        return result
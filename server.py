@@ -0,0 +1,265 @@
+"""This serves the engine to other programs over a local socket.
+
+Requests and replies are one line of JSON each, over TCP or a Unix
+socket. A position is a PDN FEN string (see pdn.py), and a search is
+limited by depth, time in seconds or both:
+
+    {"id": 1, "fen": "B:W21-32:B1-12", "depth": 8, "time": 1.0}
+    {"id": 1, "move": "9-13", "score": 0, "depth": 8, "pv": [...], ...}
+
+Sending {"id": 1, "cancel": true} stops request 1 early; a search that
+had already started replies with its best move so far and
+"cancelled": true. Scores are from Red's (White's) point of view, as in
+the rest of the engine. Many requests can be in flight on one
+connection, and replies come back as each search finishes.
+
+Searches run on a pool of worker processes, one at a time per worker;
+the rest wait in a bounded queue. Each worker opens the opening book and
+the endgame tablebase once, and since both are memory-mapped the OS
+shares them between the workers.
+
+    python server.py --port 8765 --workers 4
+    python server.py --unix /tmp/checkers.sock
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Array
+
+import book
+import evaluation
+import tablebase
+from analyze import analyze_position
+from engine import Position
+from pdn import parse_fen
+from search import MAX_DEPTH, Searcher
+
+logger = logging.getLogger(__name__)
+
+# A request with neither limit is searched for this many seconds.
+DEFAULT_TIME = 1.0
+
+# These are only set inside worker processes, by _init_worker.
+_searcher = None
+_book = None
+_cancel_flags = None
+
+
+def _init_worker(cancel_flags):
+    """This sets up the per-process searcher, book and tablebase."""
+    global _searcher, _book, _cancel_flags
+    _searcher = Searcher(tablebase=tablebase.load(),
+                         evaluator=evaluation.load())
+    _book = book.load()
+    _cancel_flags = cancel_flags
+
+
+class _CancelFlag:
+    """This lets the search poll a worker's slot in the shared cancel flags."""
+
+    def __init__(self, slot):
+        self.slot = slot
+
+    def is_set(self):
+        return bool(_cancel_flags[self.slot])
+
+
+def _analyze(packed, depth, time_limit, use_book, slot):
+    """This finds the best move for a packed position in a worker."""
+    return analyze_position(_searcher, Position.unpack(packed), depth,
+                            time_limit, _book if use_book else None,
+                            _CancelFlag(slot))
+
+
+class AnalysisServer:
+    """This queues analysis requests and runs them on a process pool."""
+
+    def __init__(self, workers=None, max_queue=256, max_time=60.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.max_time = max_time
+        # One cancel flag per worker slot. At most one search runs in each
+        # slot, so a flag is never shared by two searches.
+        self.cancel_flags = Array("b", self.workers, lock=False)
+        self.free_slots = list(range(self.workers))
+        self.slots = asyncio.Semaphore(self.workers)
+        self.waiting = 0
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            initializer=_init_worker,
+                                            initargs=(self.cancel_flags,))
+
+    def shutdown(self):
+        """This stops the worker processes."""
+        self.executor.shutdown(cancel_futures=True)
+
+    def limits(self, request):
+        """This reads the depth and time limits of a request."""
+        depth = request.get("depth")
+        time_limit = request.get("time")
+        if depth is None and time_limit is None:
+            time_limit = DEFAULT_TIME
+        depth = MAX_DEPTH if depth is None else int(depth)
+        if not 1 <= depth <= MAX_DEPTH:
+            raise ValueError(f"depth must be between 1 and {MAX_DEPTH}")
+        # A depth-only search is still stopped after max_time.
+        time_limit = min(math.inf if time_limit is None else float(time_limit),
+                         self.max_time)
+        if not time_limit > 0:
+            raise ValueError("time must be positive")
+        return depth, time_limit
+
+    async def analyze(self, request):
+        """This runs one request's search and returns its reply fields."""
+        if not isinstance(request["fen"], str):
+            raise ValueError("fen must be a string")
+        position = parse_fen(request["fen"])
+        depth, time_limit = self.limits(request)
+        if self.waiting >= self.max_queue:
+            raise ValueError("the server is busy; try again later")
+
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        slot = self.free_slots.pop()
+        self.cancel_flags[slot] = 0
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self.executor, _analyze,
+                                          position.pack(), depth, time_limit,
+                                          request.get("book", True), slot)
+        except BaseException:
+            self.release(slot)
+            raise
+        # The slot is only reused once the search has really finished, even
+        # if this task is cancelled again while it winds down.
+        future.add_done_callback(lambda _: self.release(slot))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The search stops at its next clock check.
+            self.cancel_flags[slot] = 1
+            reply = await asyncio.shield(future)
+            reply["cancelled"] = True
+            return reply
+
+    def release(self, slot):
+        """This hands a worker slot back to the queue."""
+        self.free_slots.append(slot)
+        self.slots.release()
+
+    async def respond(self, request, send):
+        """This answers one request, reporting errors back to the client."""
+        reply = {"id": request.get("id")}
+        try:
+            reply.update(await self.analyze(request))
+        except asyncio.CancelledError:
+            # Cancelled while still queued, so there is no move at all.
+            reply.update(move=None, cancelled=True)
+        except (KeyError, TypeError, ValueError) as error:
+            reply["error"] = (f"missing {error}" if isinstance(error, KeyError)
+                              else str(error))
+        except Exception:
+            # Anything else is a bug, but the client still gets an answer.
+            logger.exception("Request %r failed", request.get("id"))
+            reply["error"] = "internal error"
+        try:
+            await send(reply)
+        except ConnectionError:
+            # The client has gone, so there is no one to tell.
+            pass
+
+    async def handle(self, reader, writer):
+        """This serves one connection until the client hangs up."""
+        lock = asyncio.Lock()
+        tasks = {}
+
+        async def send(reply):
+            async with lock:
+                if writer.is_closing():
+                    return
+                text = json.dumps(reply, allow_nan=False)
+                writer.write(text.encode() + b"\n")
+                await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("a request must be a JSON object")
+                except ValueError as error:
+                    await send({"id": None, "error": str(error)})
+                    continue
+                key = request.get("id")
+                if request.get("cancel"):
+                    if key in tasks:
+                        tasks[key].cancel()
+                    continue
+                if key in tasks:
+                    await send({"id": key, "error": "id already in use"})
+                    continue
+                task = asyncio.create_task(self.respond(request, send))
+                tasks[key] = task
+                task.add_done_callback(lambda _, key=key: tasks.pop(key, None))
+        except ConnectionError:
+            pass
+        finally:
+            # Searches for a client that has gone are not worth finishing.
+            for task in list(tasks.values()):
+                task.cancel()
+            writer.close()
+
+
+async def serve(server, host="127.0.0.1", port=8765, unix=None):
+    """This accepts connections until the process is stopped."""
+    if unix:
+        listener = await asyncio.start_unix_server(server.handle, unix)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+    address = unix or f"{host}:{port}"
+    print(f"Analysing on {address} with {server.workers} workers")
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on this Unix socket instead")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-queue",
+                        type=int,
+                        default=256,
+                        help="requests allowed to wait for a worker "
+                        "(default 256)")
+    parser.add_argument("--max-time",
+                        type=float,
+                        default=60.0,
+                        help="the longest any one search may run, in seconds "
+                        "(default 60)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    async def run():
+        server = AnalysisServer(args.workers, args.max_queue, args.max_time)
+        try:
+            await serve(server, args.host, args.port, args.unix)
+        finally:
+            server.shutdown()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
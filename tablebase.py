@@ -0,0 +1,349 @@
+"""This builds and probes endgame tablebases.
+
+A tablebase stores the exact result of every position with up to a few
+pieces: whether the side to move wins, loses or draws with best play,
+and in how many plies. The generator works backwards from the finished
+games (retrograde analysis) using the engine's own move generator, so
+forced captures, kinging and Regicide are all included.
+
+Positions are grouped by material, e.g. one Red man and one Black king.
+Within a group each position has a fixed index worked out from the
+squares of each kind of piece, so the file needs no keys and holds one
+byte per position. The file is memory-mapped rather than read in.
+
+    python tablebase.py --pieces 3 --output endgame.tb
+"""
+
+import argparse
+import logging
+import mmap
+import os
+import struct
+import time
+from itertools import combinations
+from math import comb
+
+from engine import BLACK, BLACK_KING_ROW, RED, RED_KING_ROW, Position
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CKTB"
+# Bumped whenever the rules or the index layout change.
+TABLEBASE_VERSION = 3
+HEADER = struct.Struct("<4sHHI")  # magic, version, max pieces, group count
+GROUP = struct.Struct("<4BQQ")  # piece counts, data offset, data size
+
+# Results for the side to move.
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+# Each entry is one byte: 0 for an impossible position, 1 for a draw,
+# 1 + plies for a win and 129 + plies for a loss.
+INVALID_BYTE = 0
+DRAW_BYTE = 1
+MAX_DISTANCE = 126
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "endgame.tb")
+
+
+def encode(result, distance):
+    """This packs a result and its distance in plies into one byte."""
+    if result == DRAW:
+        return DRAW_BYTE
+    distance = min(distance, MAX_DISTANCE)
+    return 1 + distance if result == WIN else 129 + distance
+
+
+def decode(value):
+    """This unpacks a byte into (result, distance), or None if invalid."""
+    if value == INVALID_BYTE:
+        return None
+    if value == DRAW_BYTE:
+        return DRAW, 0
+    if value <= 128:
+        return WIN, value - 1
+    return LOSS, value - 129
+
+
+def material(position):
+    """This returns (red men, red kings, black men, black kings)."""
+    return ((position.red & ~position.kings).bit_count(),
+            (position.red & position.kings).bit_count(),
+            (position.black & ~position.kings).bit_count(),
+            (position.black & position.kings).bit_count())
+
+
+def group_size(group):
+    """This is the number of index slots a material group needs."""
+    size = 2
+    for count in group:
+        size *= comb(32, count)
+    return size
+
+
+def _rank(bits):
+    """This is the combinatorial rank of a set of squares."""
+    rank = 0
+    position = 1
+    while bits:
+        low = bits & -bits
+        rank += comb(low.bit_length() - 1, position)
+        position += 1
+        bits ^= low
+    return rank
+
+
+def index_of(position):
+    """This returns the index of a position within its material group."""
+    index = 0
+    for bits in (position.red & ~position.kings, position.red & position.kings,
+                 position.black & ~position.kings,
+                 position.black & position.kings):
+        index = index * comb(32, bits.bit_count()) + _rank(bits)
+    return index * 2 + (1 if position.turn == RED else 0)
+
+
+def material_groups(max_pieces):
+    """This lists every material group with both sides present."""
+    groups = []
+    for total in range(2, max_pieces + 1):
+        for red_men in range(total + 1):
+            for red_kings in range(total + 1 - red_men):
+                for black_men in range(total + 1 - red_men - red_kings):
+                    black_kings = total - red_men - red_kings - black_men
+                    if red_men + red_kings and black_men + black_kings:
+                        groups.append(
+                            (red_men, red_kings, black_men, black_kings))
+    return groups
+
+
+class Tablebase:
+    """This is a read-only, memory-mapped tablebase file."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.handle = open(path, "rb")
+        self.data = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.max_pieces, count = HEADER.unpack_from(
+            self.data, 0)
+        if magic != MAGIC or version != TABLEBASE_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {TABLEBASE_VERSION} "
+                             "tablebase; please regenerate it.")
+        self.groups = {}
+        for number in range(count):
+            *group, offset, size = GROUP.unpack_from(
+                self.data, HEADER.size + number * GROUP.size)
+            self.groups[tuple(group)] = (offset, size)
+        self.hits = 0
+
+    def close(self):
+        """This unmaps the file."""
+        self.data.close()
+        self.handle.close()
+
+    def probe(self, position):
+        """This returns (result, distance) for the side to move, or None."""
+        group = self.groups.get(material(position))
+        if group is None:
+            return None
+        offset, _ = group
+        found = decode(self.data[offset + index_of(position)])
+        if found is not None:
+            self.hits += 1
+        return found
+
+
+def _positions(group):
+    """This yields (index, position) for every legal position of a group."""
+    red_men, red_kings, black_men, black_kings = group
+    # Men can't stand on the row where they would have been crowned.
+    kinds = ((red_men, ~RED_KING_ROW), (red_kings, -1),
+             (black_men, ~BLACK_KING_ROW), (black_kings, -1))
+    choices = []
+    for count, allowed in kinds:
+        masks = []
+        for squares in combinations(range(32), count):
+            bits = 0
+            for square in squares:
+                bits |= 1 << square
+            masks.append((_rank(bits), bits, bits & ~allowed == 0))
+        choices.append((comb(32, count), masks))
+
+    (_, red_men_masks), (size_rk, red_king_masks), (
+        size_bm, black_men_masks), (size_bk, black_king_masks) = choices
+    for rm_rank, rm_bits, rm_ok in red_men_masks:
+        if not rm_ok:
+            continue
+        for rk_rank, rk_bits, _ in red_king_masks:
+            if rm_bits & rk_bits:
+                continue
+            red = rm_bits | rk_bits
+            for bm_rank, bm_bits, bm_ok in black_men_masks:
+                if not bm_ok or red & bm_bits:
+                    continue
+                for bk_rank, bk_bits, _ in black_king_masks:
+                    if (red | bm_bits) & bk_bits:
+                        continue
+                    index = ((rm_rank * size_rk + rk_rank) * size_bm +
+                             bm_rank) * size_bk + bk_rank
+                    for turn_index, turn in enumerate((BLACK, RED)):
+                        yield index * 2 + turn_index, Position(
+                            red, bm_bits | bk_bits, rk_bits | bk_bits, turn)
+
+
+def _solve_level(groups, offsets, solved, data):
+    """This solves every group with the same number of pieces together.
+
+    Kinging moves positions between groups of the same size, so they
+    depend on each other; captures lead to smaller groups, which are
+    already in data. Results are found in order of distance, so wins are
+    as fast and losses as slow as possible.
+    """
+    # Everything is keyed by the position's offset in the file.
+    predecessors = {}
+    remaining = {}
+    win_distance = {}
+    loss_distance = {}
+    has_draw = set()
+    buckets = [[] for _ in range(MAX_DISTANCE + 2)]
+    level_groups = set(groups)
+
+    def push(distance, key):
+        buckets[min(distance, MAX_DISTANCE + 1)].append(key)
+
+    for group in groups:
+        base = offsets[group][0]
+        for index, position in _positions(group):
+            key = base + index
+            moves = position.legal_moves()
+            if not moves:
+                # A player who is unable to make a valid move loses.
+                loss_distance[key] = 0
+                remaining[key] = 0
+                push(0, key)
+                continue
+            remaining[key] = 0
+            for move in moves:
+                position.make_move(move)
+                if not position.red or not position.black:
+                    # Capturing the last piece wins on the spot.
+                    win_distance[key] = 1
+                else:
+                    child_group = material(position)
+                    child = offsets[child_group][0] + index_of(position)
+                    if child_group in level_groups:
+                        predecessors.setdefault(child, []).append(key)
+                        remaining[key] += 1
+                    else:
+                        result, distance = decode(data[child])
+                        if result == LOSS:
+                            win_distance[key] = min(
+                                win_distance.get(key, distance + 1),
+                                distance + 1)
+                        elif result == WIN:
+                            loss_distance[key] = max(
+                                loss_distance.get(key, 0), distance + 1)
+                        else:
+                            has_draw.add(key)
+                position.unmake_move()
+            if key in win_distance:
+                push(win_distance[key], key)
+            elif remaining[key] == 0:
+                if key in has_draw:
+                    data[key] = DRAW_BYTE
+                    solved.add(key)
+                else:
+                    push(loss_distance.get(key, 0), key)
+
+    for distance, bucket in enumerate(buckets):
+        for key in bucket:
+            if key in solved:
+                continue
+            solved.add(key)
+            is_win = key in win_distance
+            data[key] = encode(WIN if is_win else LOSS, distance)
+            for parent in predecessors.get(key, ()):
+                if parent in solved:
+                    continue
+                if not is_win:
+                    # Moving into a lost position wins for the parent.
+                    if distance + 1 < win_distance.get(parent, MAX_DISTANCE + 2):
+                        win_distance[parent] = distance + 1
+                        push(distance + 1, parent)
+                else:
+                    remaining[parent] -= 1
+                    loss_distance[parent] = max(loss_distance.get(parent, 0),
+                                                distance + 1)
+                    if (remaining[parent] == 0 and parent not in win_distance
+                            and parent not in has_draw):
+                        push(loss_distance[parent], parent)
+
+    # Whatever couldn't be forced either way is a draw.
+    for group in groups:
+        base = offsets[group][0]
+        for index in range(group_size(group)):
+            key = base + index
+            if key in remaining and key not in solved:
+                data[key] = DRAW_BYTE
+                solved.add(key)
+
+
+def generate(max_pieces, path=DEFAULT_PATH, progress=None):
+    """This builds a tablebase for up to max_pieces pieces and writes it out."""
+    groups = material_groups(max_pieces)
+    offset = HEADER.size + GROUP.size * len(groups)
+    offsets = {}
+    for group in groups:
+        offsets[group] = (offset, group_size(group))
+        offset += group_size(group)
+    data = bytearray(offset)
+    solved = set()
+
+    for total in range(2, max_pieces + 1):
+        level = [group for group in groups if sum(group) == total]
+        start = time.perf_counter()
+        _solve_level(level, offsets, solved, data)
+        if progress is not None:
+            progress(total, time.perf_counter() - start)
+
+    HEADER.pack_into(data, 0, MAGIC, TABLEBASE_VERSION, max_pieces,
+                     len(groups))
+    for number, group in enumerate(groups):
+        GROUP.pack_into(data, HEADER.size + number * GROUP.size, *group,
+                        *offsets[group])
+    with open(path, "wb") as handle:
+        handle.write(data)
+    return path
+
+
+def load(path=DEFAULT_PATH):
+    """This opens the tablebase if the file exists, or returns None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return Tablebase(path)
+    except ValueError as error:
+        logger.warning("%s", error)
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an endgame tablebase.")
+    parser.add_argument("--pieces",
+                        type=int,
+                        default=3,
+                        help="the most pieces on the board (default 3)")
+    parser.add_argument("--output", default=DEFAULT_PATH)
+    args = parser.parse_args()
+    generate(args.pieces,
+             args.output,
+             progress=lambda total, seconds: print(
+                 f"{total} pieces solved in {seconds:.1f}s"))
+    print(f"Wrote {args.output} ({os.path.getsize(args.output)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
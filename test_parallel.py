@@ -0,0 +1,13 @@
+"""These are tests for the parallel root search."""
+
+from parallel import ParallelSearcher
+from pdn import parse_fen
+
+
+def test_search_lost_position_still_plays_a_move():
+    # Red's two moves both lose to Black within four plies.
+    position = parse_fen("W:W2,23:B15,16,25")
+    with ParallelSearcher(2) as parallel:
+        score, move = parallel.search(position, 4)
+    assert score == float('-inf')
+    assert move in position.legal_moves()
@@ -0,0 +1,14 @@
+"""These are tests for the tournament's rating estimate."""
+
+import pytest
+
+from pdn import BLACK_WINS, RED_WINS
+from tournament import estimate_elo
+
+
+def test_estimate_elo_three_wins_in_four():
+    games = [{"black": "a", "red": "b", "result": BLACK_WINS}] * 3
+    games.append({"black": "a", "red": "b", "result": RED_WINS})
+    ratings = estimate_elo(games, ["a", "b"])
+    assert ratings["a"] == pytest.approx(95.4, abs=0.1)
+    assert ratings["b"] == pytest.approx(-95.4, abs=0.1)
@@ -0,0 +1,307 @@
+"""This plays engine-vs-engine games without the window.
+
+Each engine is a named search setting, a depth limit, a time limit per
+move or both, e.g. "d6:depth=6" or "fast:time=0.2", optionally with a
+tuned weights file, e.g. "tuned:depth=6,weights=weights.json". Every pair of
+engines plays the same number of games from each side, and each pair of
+games starts from the same few random moves with the colours swapped,
+so neither engine gets the easier opening. Games are spread over worker
+processes and written out in PDN or as compact game records (see
+records.py), and the report gives each engine's
+score, an Elo estimate, its average time per move and its nodes per
+second.
+
+    python tournament.py --engine d4:depth=4 --engine d6:depth=6 --games 20
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations
+
+import evaluation
+import records
+import tablebase
+from engine import BLACK, RED, Position
+from pdn import BLACK_WINS, DRAW, RED_WINS, pdn_record
+from search import MAX_DEPTH, Searcher
+
+# A game with no result after this many plies is called a draw.
+MAX_PLIES = 200
+
+
+def parse_engine(text):
+    """This turns "name:depth=6,time=0.5,weights=file.json" into a tuple.
+
+    The tuple is (name, depth, time_limit, weights path). Without a
+    weights file the engine uses the position's own score.
+    """
+    name, _, settings = text.partition(":")
+    depth = MAX_DEPTH
+    time_limit = None
+    weights = None
+    for setting in filter(None, settings.split(",")):
+        key, _, value = setting.partition("=")
+        if key == "depth":
+            depth = int(value)
+        elif key == "time":
+            time_limit = float(value)
+        elif key == "weights":
+            weights = value
+        else:
+            raise ValueError(f"Unknown engine setting {key!r} in {text!r}")
+    if depth == MAX_DEPTH and time_limit is None:
+        raise ValueError(f"Engine {text!r} needs a depth or a time limit")
+    # evaluation.load() falls back to the default weights when the file is
+    # missing, which would quietly make a misspelt engine the default one.
+    if weights is not None and not os.path.exists(weights):
+        raise FileNotFoundError(f"No weight file {weights!r} for {text!r}")
+    return name, depth, time_limit, weights
+
+
+# This is only set inside worker processes, by _init_worker.
+_tablebase = None
+
+
+def _init_worker():
+    """This loads the tablebase once per process."""
+    global _tablebase
+    _tablebase = tablebase.load()
+
+
+def play_game(round_number, black, red, opening_seed, random_plies,
+              max_plies=MAX_PLIES):
+    """This plays one game between two engines from parse_engine."""
+    position = Position.initial()
+    generator = random.Random(opening_seed)
+    engines = {BLACK: black, RED: red}
+    searchers = {
+        color: Searcher(tablebase=_tablebase,
+                        evaluator=evaluation.load(engine[3])
+                        if engine[3] else None)
+        for color, engine in engines.items()
+    }
+    stats = {color: {"moves": 0, "time": 0.0, "nodes": 0} for color in engines}
+    moves = []
+    seen = {position.hash: 1}
+    result = None
+    termination = "normal"
+
+    while result is None:
+        winner = position.winner()
+        if winner is not None:
+            result = BLACK_WINS if winner == BLACK else RED_WINS
+            break
+        if len(moves) >= max_plies:
+            result, termination = DRAW, "move limit"
+            break
+
+        color = position.turn
+        if len(moves) < random_plies:
+            # Both games of a pair open with the same random moves.
+            move = generator.choice(sorted(position.legal_moves()))
+        else:
+            _, depth, time_limit, _ = engines[color]
+            searcher = searchers[color]
+            start = time.perf_counter()
+            found = searcher.iterative_deepening(
+                position, time_limit if time_limit is not None else math.inf,
+                depth)
+            stats[color]["time"] += time.perf_counter() - start
+            stats[color]["moves"] += 1
+            stats[color]["nodes"] += (searcher.nodes +
+                                      searcher.quiescence_nodes)
+            move = found.move
+        position.make_move(move)
+        moves.append(move)
+
+        # A position seen three times with the same side to move is a draw.
+        seen[position.hash] = seen.get(position.hash, 0) + 1
+        if seen[position.hash] >= 3:
+            result, termination = DRAW, "repetition"
+
+    return {
+        "round": round_number,
+        "black": black[0],
+        "red": red[0],
+        "result": result,
+        "termination": termination,
+        "moves": moves,
+        "stats": {black[0] if color == BLACK else red[0]: stats[color]
+                  for color in engines},
+    }
+
+
+def schedule(engines, games_per_pair, seed):
+    """This lists (round, black, red, opening seed) for every game.
+
+    Games come in pairs from the same opening with the colours swapped.
+    """
+    generator = random.Random(seed)
+    games = []
+    for first, second in combinations(engines, 2):
+        for number in range(games_per_pair):
+            if number % 2 == 0:
+                opening_seed = generator.getrandbits(32)
+                black, red = first, second
+            else:
+                black, red = second, first
+            games.append((len(games) + 1, black, red, opening_seed))
+    return games
+
+
+def estimate_elo(games, names, iterations=1000, tolerance=1e-6):
+    """This estimates ratings from the results, averaging zero.
+
+    Each engine's rating is repeatedly moved halfway to its performance
+    rating, the mean rating of its opponents plus the Elo difference its
+    score implies, until the ratings settle. Moving all the way makes two
+    engines swap ratings every iteration. Scores are kept off 0% and 100%
+    so the estimate stays finite.
+    """
+    ratings = {name: 0.0 for name in names}
+    for _ in range(iterations):
+        updated = {}
+        for name in names:
+            played = [game for game in games if name in (game["black"],
+                                                         game["red"])]
+            if not played:
+                updated[name] = 0.0
+                continue
+            points = sum(game_points(game, name) for game in played)
+            score = min(max(points / len(played), 0.5 / len(played)),
+                        1 - 0.5 / len(played))
+            opponents = sum(ratings[game["red"] if game["black"] == name else
+                                    game["black"]] for game in played)
+            updated[name] = (opponents / len(played) +
+                             400 * math.log10(score / (1 - score)))
+        updated = {name: (ratings[name] + rating) / 2
+                   for name, rating in updated.items()}
+        mean = sum(updated.values()) / len(updated)
+        updated = {name: rating - mean for name, rating in updated.items()}
+        change = max(abs(updated[name] - ratings[name]) for name in names)
+        ratings = updated
+        if change < tolerance:
+            break
+    return ratings
+
+
+def game_points(game, name):
+    """This returns 1 for a win, 0.5 for a draw and 0 for a loss."""
+    if game["result"] == DRAW:
+        return 0.5
+    black_won = game["result"] == BLACK_WINS
+    return 1.0 if black_won == (game["black"] == name) else 0.0
+
+
+def report(games, names):
+    """This summarizes the results for each engine."""
+    ratings = estimate_elo(games, names)
+    rows = {}
+    for name in names:
+        played = [game for game in games if name in (game["black"],
+                                                     game["red"])]
+        points = [game_points(game, name) for game in played]
+        moves = sum(game["stats"][name]["moves"] for game in played)
+        elapsed = sum(game["stats"][name]["time"] for game in played)
+        nodes = sum(game["stats"][name]["nodes"] for game in played)
+        rows[name] = {
+            "games": len(played),
+            "wins": points.count(1.0),
+            "draws": points.count(0.5),
+            "losses": points.count(0.0),
+            "score": sum(points) / len(played) if played else 0.0,
+            "elo": round(ratings[name], 1),
+            "average_move_time": elapsed / moves if moves else 0.0,
+            "nodes_per_second": nodes / elapsed if elapsed else 0.0,
+        }
+    return rows
+
+
+def run(engines, games_per_pair, workers=None, random_plies=4, seed=2024,
+        max_plies=MAX_PLIES, progress=None):
+    """This plays the whole tournament and returns the games in order."""
+    games = []
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker) as executor:
+        futures = [
+            executor.submit(play_game, round_number, black, red, opening_seed,
+                            random_plies, max_plies)
+            for round_number, black, red, opening_seed in schedule(
+                engines, games_per_pair, seed)
+        ]
+        for future in as_completed(futures):
+            games.append(future.result())
+            if progress is not None:
+                progress(games[-1], len(games), len(futures))
+    games.sort(key=lambda game: game["round"])
+    return games
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine",
+                        action="append",
+                        required=True,
+                        help='an engine as "name:depth=6,time=0.5" with an '
+                        'optional ",weights=file.json"; give at least two')
+    parser.add_argument("--games",
+                        type=int,
+                        default=10,
+                        help="games per pair of engines (default 10)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--random-plies",
+                        type=int,
+                        default=4,
+                        help="random opening moves before the engines take "
+                        "over (default 4)")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES)
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("--pdn", help="write the games to this PDN file")
+    parser.add_argument("--record",
+                        help="append the games to this game record file")
+    parser.add_argument("--output", help="write the report here as JSON")
+    args = parser.parse_args()
+
+    engines = [parse_engine(text) for text in args.engine]
+    names = [engine[0] for engine in engines]
+    if len(engines) < 2 or len(set(names)) != len(names):
+        parser.error("give at least two engines with different names")
+
+    games = run(engines,
+                args.games,
+                args.workers,
+                args.random_plies,
+                args.seed,
+                args.max_plies,
+                progress=lambda game, done, total: print(
+                    f"[{done}/{total}] {game['black']} (Black) vs "
+                    f"{game['red']} (Red): {game['result']}, "
+                    f"{len(game['moves'])} plies, {game['termination']}"))
+    if args.pdn:
+        with open(args.pdn, "w") as handle:
+            handle.write("\n".join(pdn_record(game) for game in games))
+    if args.record:
+        with records.GameWriter(args.record) as writer:
+            for game in games:
+                writer.append(game["moves"], game["result"])
+
+    rows = report(games, names)
+    print(f"{'engine':<12}{'games':>6}{'score':>8}{'elo':>8}"
+          f"{'move time':>11}{'nps':>10}")
+    for name, row in sorted(rows.items(), key=lambda item: -item[1]["elo"]):
+        print(f"{name:<12}{row['games']:>6}{row['score']:>8.3f}"
+              f"{row['elo']:>8.0f}{row['average_move_time']:>10.3f}s"
+              f"{row['nodes_per_second']:>10.0f}")
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(rows, handle, indent=2)
+            handle.write("\n")
+
+
+if __name__ == "__main__":
+    main()
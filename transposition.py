@@ -0,0 +1,83 @@
+"""This is the transposition table that lets minimax reuse earlier results."""
+
+# Bound types: how a stored score relates to the true minimax value.
+EXACT = 0
+LOWER = 1  # The search failed high, so the true value is at least the score.
+UPPER = 2  # The search failed low, so the true value is at most the score.
+
+# Replacement policies for when two positions map to the same slot.
+ALWAYS = "always"
+DEPTH_PREFERRED = "depth"
+
+
+class TranspositionTable:
+    """This is a fixed-size table of search results keyed by Zobrist hash."""
+
+    def __init__(self, size=1 << 18, replacement=DEPTH_PREFERRED):
+        if replacement not in (ALWAYS, DEPTH_PREFERRED):
+            raise ValueError(f"Unknown replacement policy: {replacement}")
+        # The size is rounded down to a power of two so a mask picks the slot.
+        self.size = 1 << max(size, 1).bit_length() - 1
+        self.mask = self.size - 1
+        self.replacement = replacement
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        """This empties the table and resets the counters."""
+        # Each slot is None or (hash, depth, score, bound, move, generation).
+        self.slots = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def new_search(self):
+        """This marks older entries as replaceable before the next move."""
+        self.generation += 1
+
+    def probe(self, key):
+        """This returns (depth, score, bound, move) for the hash, or None."""
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1:5]
+        self.misses += 1
+        return None
+
+    def peek(self, key):
+        """This is probe without touching the counters, e.g. to read the PV."""
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry[1:5]
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        """This saves a result, subject to the replacement policy."""
+        index = key & self.mask
+        entry = self.slots[index]
+        if entry is not None and entry[0] != key:
+            # Deeper results from the current search are worth keeping.
+            if (self.replacement == DEPTH_PREFERRED and
+                    entry[5] == self.generation and entry[1] > depth):
+                return
+            self.overwrites += 1
+        self.slots[index] = (key, depth, score, bound, move, self.generation)
+        self.stores += 1
+
+    def usage(self):
+        """This returns the fraction of slots that hold an entry."""
+        return sum(1 for entry in self.slots if entry is not None) / self.size
+
+    def report(self):
+        """This summarizes the counters, which is useful for sizing the table."""
+        probes = self.hits + self.misses
+        return {
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / probes if probes else 0.0,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+            "usage": self.usage(),
+        }
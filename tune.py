@@ -0,0 +1,178 @@
+"""This tunes the evaluation weights from recorded games (Texel tuning).
+
+Every quiet position in the games is labelled with how the game ended
+for Red: 1 for a win, 0.5 for a draw and 0 for a loss. The weights are
+then fitted so that a logistic curve of the evaluation predicts those
+labels as closely as possible, by mean squared error:
+
+    predicted = 1 / (1 + 10 ** (-scale * score / 400))
+
+The games are streamed from the PDN files in batches on every pass, so
+the record set can be much larger than memory. Each batch is turned
+into a feature matrix with NumPy, which this script needs.
+
+    python tune.py games.pdn more.pdn --epochs 20 --output weights.json
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+import evaluation
+from engine import Position
+from evaluation import FEATURES, batch_features, board_planes
+from pdn import BLACK_WINS, DRAW, RED_WINS, read_games
+
+# How each result is scored for Red.
+LABELS = {BLACK_WINS: 0.0, DRAW: 0.5, RED_WINS: 1.0}
+
+# The scales tried when fitting the curve to the starting weights.
+SCALE_CANDIDATES = (0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0)
+
+
+def positions(paths, skip_plies=8):
+    """This yields (packed position, label) for every quiet position.
+
+    The first few plies are skipped, since they are often random or from
+    the book. Positions where the side to move has a capture are skipped
+    too, because the evaluation can't see how the exchange ends.
+    """
+    for path in paths:
+        with open(path) as handle:
+            for _, moves, result in read_games(handle):
+                label = LABELS[result]
+                position = Position.initial()
+                for ply, move in enumerate(moves):
+                    if ply >= skip_plies and not position.has_captures():
+                        yield position.pack(), label
+                    position.make_move(move)
+
+
+def batches(paths, batch_size=4096, skip_plies=8):
+    """This yields (features, labels) arrays of up to batch_size positions."""
+    boards = []
+    labels = []
+    for board, label in positions(paths, skip_plies):
+        boards.append(board)
+        labels.append(label)
+        if len(boards) == batch_size:
+            yield batch_features(board_planes(boards)).astype(float), np.array(
+                labels)
+            boards = []
+            labels = []
+    if boards:
+        yield batch_features(board_planes(boards)).astype(float), np.array(
+            labels)
+
+
+def predict(features, weights, scale):
+    """This is the logistic curve from evaluation to expected result."""
+    return 1 / (1 + np.power(10.0, -scale * (features @ weights) / 400))
+
+
+def mean_error(paths, weights, scale, batch_size=4096, skip_plies=8):
+    """This is the mean squared error of the predictions over every position."""
+    total = 0.0
+    count = 0
+    for features, labels in batches(paths, batch_size, skip_plies):
+        total += float(((labels - predict(features, weights, scale))**2).sum())
+        count += len(labels)
+    return total / count if count else 0.0
+
+
+def fit_scale(paths, weights, batch_size=4096, skip_plies=8):
+    """This picks the scale that best fits the starting weights.
+
+    The scale is then held fixed while the weights are tuned, since
+    scaling every weight up does the same job.
+    """
+    errors = {
+        scale: mean_error(paths, weights, scale, batch_size, skip_plies)
+        for scale in SCALE_CANDIDATES
+    }
+    return min(errors, key=errors.get)
+
+
+def tune(paths,
+         epochs=20,
+         learning_rate=1.0,
+         batch_size=4096,
+         skip_plies=8,
+         start=None,
+         progress=None):
+    """This fits the weights with mini-batch gradient descent (Adam).
+
+    It returns (weights as a dict, scale, final error, positions per pass).
+    """
+    weights = np.array(
+        [float((start or evaluation.DEFAULT_WEIGHTS)[name])
+         for name in FEATURES])
+    scale = fit_scale(paths, weights, batch_size, skip_plies)
+    # Adam keeps running averages of the gradient and its square, which
+    # copes with features on very different scales.
+    mean = np.zeros_like(weights)
+    square = np.zeros_like(weights)
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    step = 0
+    count = 0
+    for epoch in range(epochs):
+        total = 0.0
+        count = 0
+        for features, labels in batches(paths, batch_size, skip_plies):
+            predicted = predict(features, weights, scale)
+            error = predicted - labels
+            total += float((error**2).sum())
+            count += len(labels)
+            # The derivative of the squared error through the logistic curve.
+            slope = predicted * (1 - predicted) * scale * math.log(10) / 400
+            gradient = 2 * features.T @ (error * slope) / len(labels)
+            step += 1
+            mean = beta1 * mean + (1 - beta1) * gradient
+            square = beta2 * square + (1 - beta2) * gradient**2
+            weights -= (learning_rate * (mean / (1 - beta1**step)) /
+                        (np.sqrt(square / (1 - beta2**step)) + epsilon))
+        if progress is not None:
+            progress(epoch + 1, total / count if count else 0.0)
+    final = dict(zip(FEATURES, (round(float(value), 3) for value in weights)))
+    error = mean_error(paths, weights, scale, batch_size, skip_plies)
+    return final, scale, error, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("games", nargs="+", help="PDN files to learn from")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--learning-rate", type=float, default=1.0)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--skip-plies",
+                        type=int,
+                        default=8,
+                        help="opening plies left out of each game (default 8)")
+    parser.add_argument("--output", default=evaluation.DEFAULT_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    weights, scale, error, count = tune(
+        args.games,
+        args.epochs,
+        args.learning_rate,
+        args.batch_size,
+        args.skip_plies,
+        progress=lambda epoch, error: print(
+            f"epoch {epoch}: mean squared error {error:.5f}"))
+    evaluation.save_weights(weights,
+                            args.output,
+                            scale=scale,
+                            error=error,
+                            positions=count)
+    print(f"Tuned on {count} positions in {time.perf_counter() - start:.0f}s "
+          f"(scale {scale}, error {error:.5f})")
+    for name, value in weights.items():
+        print(f"  {name}: {value}")
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
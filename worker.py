@@ -0,0 +1,67 @@
+"""This runs AI searches in a background thread so the window stays responsive."""
+
+import threading
+
+
+class SearchJob:
+    """This is a handle on one iterative-deepening search running in a thread.
+
+    The search works on its own copy of the position, so the GUI can keep
+    reading the real board while it runs. Nothing here touches Tk; the GUI
+    polls finished() from an after() callback and then reads the result.
+    """
+
+    def __init__(self, searcher, position, time_limit, max_depth):
+        self.searcher = searcher
+        self.position = position.copy()
+        # The search makes and unmakes moves on self.position, so its hash
+        # is whatever node is being visited; the root's is kept here.
+        self.root_hash = position.hash
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.stop_event = threading.Event()
+        self.cancelled = False
+        # The latest completed iteration, readable while the search runs.
+        self.best = None
+        self.result = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        """This is the body of the worker thread."""
+        try:
+            self.result = self.searcher.iterative_deepening(
+                self.position,
+                self.time_limit,
+                self.max_depth,
+                stop_event=self.stop_event,
+                on_iteration=self._on_iteration)
+        except Exception as error:  # Reported to the GUI thread instead.
+            self.error = error
+
+    def _on_iteration(self, result):
+        """This records each completed iteration as the best so far."""
+        self.best = result
+
+    def move_now(self):
+        """This asks the search to stop and settle for its best move so far."""
+        self.stop_event.set()
+
+    def ponder_hit(self, time_limit):
+        """This turns a pondering search into a timed one for the real move."""
+        self.searcher.ponder_hit(time_limit)
+
+    def cancel(self):
+        """This stops the search and marks its result as unwanted."""
+        self.cancelled = True
+        self.stop_event.set()
+
+    def finished(self):
+        """This checks whether the worker thread has finished."""
+        return not self.thread.is_alive()
+
+    def wait(self, timeout=None):
+        """This blocks until the search finishes and returns its result."""
+        self.thread.join(timeout)
+        return self.result